@@ -1,8 +1,20 @@
-import streamlit as st
-from utils import * # Import all functions from the utils.py file
-import networkx as nx
+import functools
+import io
+from xml.etree.ElementTree import ParseError
 import pandas as pd
-import plotly.express as px
+import streamlit as st
+from utils import TIME_RESOLUTIONS, event_type_metrics, select_tweets_over_time
+from graph_cache import content_hash, load_graphs
+from graph_tables import share_dictionaries
+from datasets import ComparedDatasets, LazyDatasets
+from background import BackgroundDatasets, BackgroundLoader
+from incremental import IncrementalDatasets
+from sql_backend import ENGINES, SqlDatasets, load_sql_graph
+from snapshot import SNAPSHOT_EXTENSION, load_snapshot
+from rendering import PAGE_SIZE, downsample, num_pages, sort_page, top_n
+from diagnostics import PROFILERS, Diagnostics, activate, measure
+
+# Plotly is imported by the panels that draw with it, once a graph is uploaded (the landing page does not need it)
 
 # This script is used to create the dashboard for the Crisis Events project using Streamlit
 
@@ -14,272 +26,593 @@ st.write("Made with ❤️ by Mamady Djiguiném | Evandion Kurniadi | Bernadette
 url = "https://drive.google.com/file/d/17RakKWgDPRv8GsmzySM9iF6toCS2v1Ew/view?usp=sharing"
 st.write("Download the dataset [here](%s)!" % url)
 
-uploaded_file = st.file_uploader("Choose a file", type=['graphml'], accept_multiple_files=False)
-if uploaded_file is not None:
-    G = nx.read_graphml(uploaded_file)
-    # Key figures to describe the data
-
-    tweets_per_category_df = tweets_per_category(G)
-    priority_counts = tweets_per_priority(G)
-    priority_counts_df = pd.DataFrame(priority_counts.items(), columns=['Priority', 'Count'])
-
-    tweet_nodes = [
-        node 
-        for node, data in G.nodes(data=True) 
-        if data.get("labels") == ":Tweet"
-    ]
-
-    user_nodes = [
-        node 
-        for node, data in G.nodes(data=True) 
-        if data.get("labels") == ":User"
-    ]
-
-    hashtag_nodes = [
-        node 
-        for node, data in G.nodes(data=True) 
-        if data.get("labels") == ":Hashtag"
-    ]
-
-    num_tweets = len(tweet_nodes)
-    num_users = len(user_nodes)
-    num_hashtags = len(hashtag_nodes)
-
-    # Count the number of interactions between users
-
-    from collections import Counter
-
-    # Types d'interactions à analyser
-    user_interact_type = ["RETWEETS", "REPLIED_TO", "MENTIONS"]
-
-    # Comptage des types d'interactions entre utilisateurs
-    edge_type_counts = Counter()
-    for interact_type in user_interact_type:
-        edge_with_type = [(u, v) for u, v, data in G.edges(data=True) if data.get('label') == interact_type]
-        edge_type_counts[interact_type] = len(edge_with_type)
-
-    edge_type_counts["Retweets"] = edge_type_counts.pop("RETWEETS")
-    edge_type_counts["Replies"] = edge_type_counts.pop("REPLIED_TO")
-    edge_type_counts["Mentions"] = edge_type_counts.pop("MENTIONS")
-
-    # Créer un DataFrame pour la visualisation
-    edge_type_df = pd.DataFrame({
-        'Type of interaction': list(edge_type_counts.keys()),
-        'Number of interactions': list(edge_type_counts.values())
-    })
-
-    # Count user activity
-
-    user_activity = {}
-
-    for node, data in G.nodes(data=True):
-        if data.get('labels') == ':User':
-            user_id = data.get('name')
-            tweets = 0
-            retweets = 0
-            replies = 0
-
-            # Comptage des tweets postés par l'utilisateur
-            tweets = sum(1 for _, _, edge_data in G.edges(node, data=True) if edge_data.get('label') == 'POSTED')
-
-            # Comptage des retweets postés par l'utilisateur
-            retweets = sum(1 for _, _, edge_data in G.edges(node, data=True) if edge_data.get('label') == 'RETWEETS')
-
-            # Comptage des réponses postées par l'utilisateur
-            replies = sum(1 for _, _, edge_data in G.edges(node, data=True) if edge_data.get('label') == 'REPLIED_TO')
-
-            # Stockage des résultats
-            user_activity[user_id] = {
-                'Tweets': tweets,
-                'Retweets': retweets,
-                'Replies': replies,
-                'Total': tweets + retweets + replies
-            }
-
-    user_activity_df = pd.DataFrame.from_dict(user_activity, orient='index').reset_index()
-    user_activity_df.rename(columns={'index': 'User'}, inplace=True)
-
-    # Dashboard visuals start here
-
-    node, edges, tweets, users, hashtags = st.columns(5)
-    node.metric("Number of nodes", str(G.number_of_nodes()), border=True)
-    edges.metric("Number of edges", str(G.number_of_edges()), border=True)
-    tweets.metric("Number of tweets", str(num_tweets), border=True)
-    users.metric("Number of users", str(num_users), border=True)
-    hashtags.metric("Number of hashtags", str(num_hashtags), border=True)
-
-    # Divide in columns
-    col1, col2, col3 = st.columns([1, 2, 1])
-
-    with col1:
-        with st.container(border=True):
-            st.markdown("#### Interaction between users")
-            st.bar_chart(edge_type_df, x="Type of interaction", y="Number of interactions", horizontal=True, color="Type of interaction")
-            # interaction_fig = px.bar(edge_type_df, x='Type d\'interaction', y='Nombre d\'interactions',
-            #             title='Frequency of interactions between users',
-            #             labels={'Type d\'interaction': 'Type of interaction', 'Nombre d\'interactions': 'Number of interactions', 'RETWEETS': 'Retweets', 'REPLY_TO': 'Replies', 'MENTIONS': 'Mentions'},
-            #             text_auto=True)
-            # st.plotly_chart(interaction_fig)
-        
-        with st.container(border=True):
-            st.markdown("### Tweet priority")
-            st.bar_chart(priority_counts_df, x='Priority', y='Count', horizontal=True, color='Priority')
-        
-        with st.container(border=True):
-            st.markdown("### Tweet category")
-            st.bar_chart(tweets_per_category_df, y='Number of Tweets', x='Category', horizontal=True)
-
-    with col2:
-        
-        with st.container(border=True):
-            st.markdown("### Social activities based on sub-events")
-            option = st.selectbox(
-                "Choose the sub-event",
-                ("Flood", "Wildfire", "Earthquake", "Shooting", "Bombing", "Typhoon")
-            )
-            metrics_df = mesure_activity_intensity(G, option.lower())
-            st.markdown(f'''##### Social activity for {option.lower()}''')
-            # st.bar_chart(metrics_df, x='Event ID', y=['Tweets', 'Retweets', 'Replies'])
-
-            fig = px.bar(metrics_df, x='Event ID', y=['Tweets', 'Retweets', 'Replies'],
-                            #title=f"Social activity for {option.lower()}",
-                            labels={'value': "Number of activities", 'variable': 'Metric', 'Event ID': 'Even'},
-                            barmode='group',text_auto=True)
-            st.plotly_chart(fig)
-
-        
-        with st.container(border=True):
-            st.markdown("### Time trends in social activities")
-            event_types = set(data.get('eventType') for node, data in G.nodes(data=True) if data.get('labels') == ':Event')
-            option2 = st.selectbox(
-                "Choose the sub-event",
-                ('Bombing', 'Earthquake', 'Flood', 'Shooting', 'Typhoon', 'Wildfire')
+# Optional diagnostics: time and memory of the stages of the dashboard (loading, aggregates, panels), and profiles
+diagnostics = None
+if st.sidebar.toggle("Diagnostics"):
+    if 'diagnostics' not in st.session_state:
+        st.session_state.diagnostics = Diagnostics()
+    diagnostics = st.session_state.diagnostics
+    diagnostics.track_allocations = st.sidebar.checkbox("Track allocations (slower)")
+    profiler = st.sidebar.radio("Profiler", PROFILERS, horizontal=True)
+    if st.sidebar.button("Profile a full run"):
+        diagnostics.start_profile(profiler)
+    if st.sidebar.button("Clear"):
+        diagnostics.clear()
+st.session_state.active_diagnostics = diagnostics
+activate(diagnostics)
+
+# Storage of an uploaded GraphML: columnar tables in memory, or a database file whose aggregates are SQL queries
+BACKENDS = {"Tables (in memory)": None, **{f"SQL ({engine})": engine for engine in ENGINES}}
+backend = st.sidebar.radio("Storage backend", list(BACKENDS), help="With SQL, the graph is loaded once into an embedded database and the aggregates are queries. The central users and the interactions between users are computed in memory from the edges between users.")
+
+# Function to get the content_hash of an uploaded file, computed once per upload (reruns reuse it from the session)
+def file_hash(file):
+    hashes = st.session_state.setdefault('file_hashes', {})
+    if file.file_id not in hashes:
+        hashes[file.file_id] = content_hash(file.getvalue())
+    return hashes[file.file_id]
+
+# Sidebar of the diagnostics: the stages recorded so far, and their exports
+def show_diagnostics(diagnostics):
+    diagnostics.stop_profile()
+    st.sidebar.markdown("#### Stages")
+    st.sidebar.caption("The stages of the panels rerun on their own appear at the next full run.")
+    st.sidebar.dataframe(diagnostics.summary(), hide_index=True)
+    st.sidebar.download_button("Export the stages (JSON)", diagnostics.to_json(), file_name="dashboard-diagnostics.json", mime="application/json")
+    dump = diagnostics.profile_dump()
+    if dump is not None:
+        file_name, content = dump
+        st.sidebar.download_button("Export the profile", content, file_name=file_name)
+        text = diagnostics.profile_text()
+        if text is not None:
+            with st.sidebar.expander("Profile (cumulative time)"):
+                st.code(text)
+
+# Decorator of the panels of the dashboard. A panel declares the datasets it needs: they are computed on first access
+# (and memoized with the graph), and the panel is a fragment, so its widgets only rerun the panel itself.
+def panel(*names):
+    def decorator(function):
+        @st.fragment
+        @functools.wraps(function)
+        def wrapper(data):
+            activate(st.session_state.get('active_diagnostics'))  # a panel can rerun without the rest of the script
+            if set(names) & getattr(data, 'pending', set()):
+                # Still computed by the background loader: the panel is drawn once its datasets are ready
+                with st.container(border=True):
+                    st.caption(f"{function.__name__.removesuffix('_panel').replace('_', ' ').capitalize()}: computing...")
+                return
+            with measure('panel ' + function.__name__), st.container(border=True):
+                with st.spinner("Computing..."):
+                    datasets = [data[name] for name in names]
+                function(*datasets)
+        return wrapper
+    return decorator
+
+# Panel of the interactions between users
+@panel('interactions')
+def interactions_panel(edge_type_df):
+    st.markdown("#### Interaction between users")
+    st.bar_chart(edge_type_df, x="Type of interaction", y="Number of interactions", horizontal=True, color="Type of interaction")
+    # interaction_fig = px.bar(edge_type_df, x='Type d\'interaction', y='Nombre d\'interactions',
+    #             title='Frequency of interactions between users',
+    #             labels={'Type d\'interaction': 'Type of interaction', 'Nombre d\'interactions': 'Number of interactions', 'RETWEETS': 'Retweets', 'REPLY_TO': 'Replies', 'MENTIONS': 'Mentions'},
+    #             text_auto=True)
+    # st.plotly_chart(interaction_fig)
+
+# Panel of the priority of the tweets
+@panel('priority')
+def priority_panel(priority_counts_df):
+    st.markdown("### Tweet priority")
+    st.bar_chart(priority_counts_df, x='Priority', y='Count', horizontal=True, color='Priority')
+
+# Panel of the category of the tweets
+@panel('category')
+def category_panel(tweets_per_category_df):
+    st.markdown("### Tweet category")
+    # The largest categories, the others are summed in one bar
+    st.bar_chart(top_n(tweets_per_category_df, 'Category', ['Number of Tweets']), y='Number of Tweets', x='Category', horizontal=True)
+
+# Panel of the social activities of the events of a type
+@panel('event_metrics')
+def sub_events_panel(event_metrics_df):
+    st.markdown("### Social activities based on sub-events")
+    option = st.selectbox(
+        "Choose the sub-event",
+        ("Flood", "Wildfire", "Earthquake", "Shooting", "Bombing", "Typhoon")
+    )
+    # The most active events, the others are summed in one group of bars
+    metrics_df = top_n(event_type_metrics(event_metrics_df, option.lower()), 'Event ID', ['Tweets', 'Retweets', 'Replies'])
+    st.markdown(f'''##### Social activity for {option.lower()}''')
+    # st.bar_chart(metrics_df, x='Event ID', y=['Tweets', 'Retweets', 'Replies'])
+
+    import plotly.express as px
+    fig = px.bar(metrics_df, x='Event ID', y=['Tweets', 'Retweets', 'Replies'],
+                    #title=f"Social activity for {option.lower()}",
+                    labels={'value': "Number of activities", 'variable': 'Metric', 'Event ID': 'Even'},
+                    barmode='group',text_auto=True)
+    st.plotly_chart(fig)
+
+# Panel of the number of tweets over time
+@panel('event_metrics', 'time_series')
+def time_trends_panel(event_metrics_df, time_series):
+    st.markdown("### Time trends in social activities")
+    option2 = st.selectbox(
+        "Choose the sub-event",
+        ('Bombing', 'Earthquake', 'Flood', 'Shooting', 'Typhoon', 'Wildfire')
+    )
+
+    col_event, col_resolution = st.columns(2)
+    event_option = col_event.selectbox(
+        "Choose the event",
+        ["All events"] + list(event_type_metrics(event_metrics_df, option2.lower())['Event ID'])
+    )
+    resolution = col_resolution.radio("Resolution", list(TIME_RESOLUTIONS), index=1, horizontal=True)
+
+    # Served from the precomputed tweet counts of the graph
+    event_id = None if event_option == "All events" else event_option
+    tweet_dates_df = select_tweets_over_time(time_series, option2.lower(), resolution, event_id)
+    # Long series (e.g. by hour) are downsampled to a fixed number of points, keeping the peaks
+    tweet_dates_df = downsample(tweet_dates_df, 'Date', 'Count')
+
+    st.markdown(f'''##### Number of tweets over time for {option2.lower()}''')
+    # st.bar_chart(tweet_dates_df, x='Date', y='Count')
+
+    # Visualisation l'évolution temporelle avec Plotly
+    # fig2 = px.line(tweet_dates_df, x='Date', y='Count', 
+    #                labels={'Count': "Nombre de tweets", 'Date': 'Date'},
+    #                title=f"Évolution du nombre de tweets par jour pour l'événement {option2.lower()}")
+    # col1.plotly_chart(fig2)
+
+    import plotly.express as px
+    fig2 = px.line(tweet_dates_df, x='Date', y='Count',
+        labels={'Count': "Nombre de tweets", 'Date': 'Date'},
+        #title=f"Évolution du nombre de tweets par jour pour l'événement {option2.lower()}"
+    )
+
+    # Configuration du range slider et des boutons de sélection
+    fig2.update_layout(
+        xaxis=dict(
+            rangeselector=dict(
+                buttons=list([
+                    dict(count=7,
+                        label="1 week",
+                        step="day",
+                        stepmode="backward"),
+                    dict(count=1,
+                        label="1 month",
+                        step="month",
+                        stepmode="backward"),
+                    dict(count=6,
+                        label="6 months",
+                        step="month",
+                        stepmode="backward"),
+                    dict(count=1,
+                        label="1 year",
+                        step="year",
+                        stepmode="backward"),
+                    dict(step="all")
+                ])
+            ),
+            rangeslider=dict(
+                visible=True
+            ),
+            type="date"
+        )
+    )
+
+    st.plotly_chart(fig2)
+
+# Panel of the interactions of every user (measured on the graph of the interactions between users)
+@panel('user_interactions')
+def user_interactions_panel(user_interactions):
+    st.markdown("### Interactions of the users")
+    st.write("Retweets, replies and mentions given and received by each user, the reciprocity (share of the partners who interact back) and the retweet cascade (retweets received, plus the retweets of the users who retweeted them).")
+    st.metric("Reciprocity of the interactions", f"{user_interactions['reciprocity']:.1%}")
+    users_df = user_interactions['users']
+    col_sort, col_page = st.columns([3, 1])
+    metrics = list(users_df.columns.drop(['User ID', 'User']))
+    sort_by = col_sort.selectbox("Sort by", metrics, index=metrics.index('Retweet cascade'), key='interactions_sort')
+    pages = num_pages(users_df)
+    page = col_page.number_input("Page", min_value=1, max_value=pages, value=1, key='interactions_page')
+    st.dataframe(sort_page(users_df, sort_by, page=page), hide_index=True,
+        column_config={
+            "Reciprocity": st.column_config.ProgressColumn(
+                "Reciprocity",
+                format="%.2f",
+                min_value=0,
+                max_value=1,
+            )}
+        )
+
+# Panel of the central users
+@panel('central_users')
+def central_users_panel(top_users):
+    st.markdown("#### Central users")
+    option = st.selectbox(
+        "Choose the criteria",
+        ("Ability to connect users", "Ability to spread information", "Ability to gather information")
+    )
+    top_10_connect_user_df = top_users['connect']
+    top_10_diffuse_info_df = top_users['spread']
+    top_10_ressemble_info_df = top_users['gather']
+    if top_10_connect_user_df.empty:
+        # The three rankings cover the same users
+        st.info("There are no users in this graph.")
+    elif option == "Ability to connect users":
+        st.write("This metric measures the ability of a user to connect other users (i.e. to be a bridge between them) based on the Betweeness Centrality.")
+        st.dataframe(top_10_connect_user_df,
+            #  column_order=("user", "betweenness_centrality"),
+            hide_index=True,
+            width=None,
+            column_config={
+                "user": st.column_config.TextColumn(
+                    "User ID",
+                ),
+                "betweenness_centrality": st.column_config.ProgressColumn(
+                    "Betweenness Centrality",
+                    format="%f",
+                    min_value=0,
+                    max_value=max(top_10_connect_user_df.betweenness_centrality),
+                )}
             )
-
-            event_ids = [data.get('id') for node, data in G.nodes(data=True) if data.get('labels') == ':Event' and data.get('eventType') == option2.lower()]
-            tweets = [source for source, target, data in G.edges(data=True) if data.get('label') == 'IS_ABOUT' and G.nodes[target].get('id') in event_ids]
-
-            tweet_dates = [data.get('created_at') for node, data in G.nodes(data=True) if node in tweets]
-            tweet_dates = pd.to_datetime(tweet_dates)
-
-            tweet_dates_df = pd.DataFrame(tweet_dates, columns=['Date'])
-            tweet_dates_df['Count'] = 1
-            tweet_dates_df = tweet_dates_df.resample('D', on='Date').sum().reset_index()
-
-            st.markdown(f'''##### Number of tweets over time for {option2.lower()}''')
-            # st.bar_chart(tweet_dates_df, x='Date', y='Count')
-
-            # Visualisation l'évolution temporelle avec Plotly
-            # fig2 = px.line(tweet_dates_df, x='Date', y='Count', 
-            #                labels={'Count': "Nombre de tweets", 'Date': 'Date'},
-            #                title=f"Évolution du nombre de tweets par jour pour l'événement {option2.lower()}")
-            # col1.plotly_chart(fig2)
-
-            fig2 = px.line(tweet_dates_df, x='Date', y='Count',
-                labels={'Count': "Nombre de tweets", 'Date': 'Date'},
-                #title=f"Évolution du nombre de tweets par jour pour l'événement {option2.lower()}"
+    elif option == "Ability to spread information":
+        st.write("This metric measures the ability of a user to spread information to a (potentially) large(r) number of users, based on the number of times the user has been retweeted.")
+        st.dataframe(top_10_diffuse_info_df,
+            column_order=("user", "nombre_de_fois_retweete"),
+            hide_index=True,
+            width=None,
+            column_config={
+                "user": st.column_config.TextColumn(
+                    "User ID",
+                ),
+                "nombre_de_fois_retweete": st.column_config.ProgressColumn(
+                    "Number of times retweeted",
+                    format="%f",
+                    min_value=0,
+                    max_value=max(top_10_diffuse_info_df.nombre_de_fois_retweete),
+                )}
             )
-
-            # Configuration du range slider et des boutons de sélection
-            fig2.update_layout(
-                xaxis=dict(
-                    rangeselector=dict(
-                        buttons=list([
-                            dict(count=7,
-                                label="1 week",
-                                step="day",
-                                stepmode="backward"),
-                            dict(count=1,
-                                label="1 month",
-                                step="month",
-                                stepmode="backward"),
-                            dict(count=6,
-                                label="6 months",
-                                step="month",
-                                stepmode="backward"),
-                            dict(count=1,
-                                label="1 year",
-                                step="year",
-                                stepmode="backward"),
-                            dict(step="all")
-                        ])
-                    ),
-                    rangeslider=dict(
-                        visible=True
-                    ),
-                    type="date"
-                )
+    else:
+        st.write("This metric measures the ability of a user to receive information or to be a source of information for other users based on Degree Centrality.")
+        st.dataframe(top_10_ressemble_info_df,
+            column_order=("user", "degree_centrality"),
+            hide_index=True,
+            width=None,
+            column_config={
+                "user": st.column_config.TextColumn(
+                    "User ID",
+                ),
+                "degree_centrality": st.column_config.ProgressColumn(
+                    "Degree Centrality",
+                    format="%f",
+                    min_value=0,
+                    max_value=max(top_10_ressemble_info_df.degree_centrality),
+                )}
             )
 
-            st.plotly_chart(fig2)
-
-    with col3:    
-        
-        with st.container(border=True):
-            st.markdown("#### Central users")
-            option = st.selectbox(
-                "Choose the criteria",
-                ("Ability to connect users", "Ability to spread information", "Ability to gather information")
-            )
-            if option == "Ability to connect users":
-                st.write("This metric measures the ability of a user to connect other users (i.e. to be a bridge between them) based on the Betweeness Centrality.")
-                st.dataframe(top_10_connect_user_df,
-                    #  column_order=("user", "betweenness_centrality"),
-                    hide_index=True,
-                    width=None,
-                    column_config={
-                        "user": st.column_config.TextColumn(
-                            "User ID",
-                        ),
-                        "betweenness_centrality": st.column_config.ProgressColumn(
-                            "Betweenness Centrality",
-                            format="%f",
-                            min_value=0,
-                            max_value=max(top_10_connect_user_df.betweenness_centrality),
-                        )}
-                    )
-            elif option == "Ability to spread information":
-                st.write("This metric measures the ability of a user to spread information to a (potentially) large(r) number of users, based on the number of times the user has been retweeted.")
-                st.dataframe(top_10_diffuse_info_df,
-                    column_order=("user", "nombre_de_fois_retweete"),
-                    hide_index=True,
-                    width=None,
-                    column_config={
-                        "user": st.column_config.TextColumn(
-                            "User ID",
-                        ),
-                        "nombre_de_fois_retweete": st.column_config.ProgressColumn(
-                            "Number of times retweeted",
-                            format="%f",
-                            min_value=0,
-                            max_value=max(top_10_diffuse_info_df.nombre_de_fois_retweete),
-                        )}
-                    )
-            else:
-                st.write("This metric measures the ability of a user to receive information or to be a source of information for other users based on Degree Centrality.")
-                st.dataframe(top_10_ressemble_info_df,
-                    column_order=("user", "degree_centrality"),
-                    hide_index=True,
-                    width=None,
-                    column_config={
-                        "user": st.column_config.TextColumn(
-                            "User ID",
-                        ),
-                        "degree_centrality": st.column_config.ProgressColumn(
-                            "Degree Centrality",
-                            format="%f",
-                            min_value=0,
-                            max_value=max(top_10_ressemble_info_df.degree_centrality),
-                        )}
-                    )
-        with st.container(border=True):
-            st.markdown("#### User activity")
-            st.write("Click on the column name to sort the data.")
-            st.write("Resize columns as you wish.")
-            st.dataframe(user_activity_df)
-
-else:
-    st.stop()
+# Panel of the activity of the users
+@panel('user_activity')
+def user_activity_panel(user_activity_df):
+    st.markdown("#### User activity")
+    st.write("The table is sorted on the server: choose the column, the order and the page.")
+    st.write("Resize columns as you wish.")
+    col_sort, col_order, col_page = st.columns([2, 1, 1])
+    sort_by = col_sort.selectbox("Sort by", list(user_activity_df.columns.drop('User ID')), index=len(user_activity_df.columns) - 2)
+    ascending = col_order.radio("Order", ("Descending", "Ascending")) == "Ascending"
+    pages = num_pages(user_activity_df)
+    page = col_page.number_input("Page", min_value=1, max_value=pages, value=1)
+    st.dataframe(sort_page(user_activity_df, sort_by, ascending, page), hide_index=True)
+    st.caption(f"{len(user_activity_df)} users, page {page} of {pages} ({PAGE_SIZE} users per page)")
+
+# Comparison of several datasets: every panel shows the datasets side by side (or overlaid for the time trends)
+
+# Function to stack the tables of a dataset of the compared graphs, with a 'Dataset' column
+def stack(tables):
+    return pd.concat([df.assign(Dataset=label) for label, df in tables.items()], ignore_index=True)
+
+# Function to get the datasets of the files to compare. The datasets of each file (and what is memoized with its graph)
+# are kept in the session while the file stays selected: adding or removing a file only loads the files added. The new
+# graphs are parsed in parallel, and their ids, names and labels are added to the dictionaries shared with the graphs
+# already loaded (the values of the files removed stay in them until the comparison is emptied).
+def compared_datasets(files):
+    keys = [file_hash(file) for file in files]
+    previous = st.session_state.get('compared', {})  # content hash -> datasets of the file
+    compared = {key: previous[key] for key in keys if key in previous}
+    added = {key: file for key, file in zip(keys, files) if key not in compared}
+    for key, file in added.items():
+        if file.name.endswith('.' + SNAPSHOT_EXTENSION):
+            try:
+                compared[key] = load_snapshot(file.getvalue())
+            except ValueError as error:
+                st.error(f"{file.name}: {error}")
+                st.stop()
+    graph_files = {key: file for key, file in added.items() if key not in compared}
+    if graph_files:
+        shared = [data.G for data in compared.values() if isinstance(data, LazyDatasets)]
+        with st.spinner("Loading the datasets..."), measure('load_graphs'):
+            graphs = load_graphs([file.getvalue() for file in graph_files.values()], remember=False, keys=list(graph_files))
+            graphs = share_dictionaries(graphs, shared)
+        compared.update(zip(graph_files, map(LazyDatasets, graphs)))
+    st.session_state.compared = compared
+    labels = [file.name if [other.name for other in files].count(file.name) == 1 else f"{file.name} ({position + 1})"
+              for position, file in enumerate(files)]
+    return ComparedDatasets({label: compared[key] for label, key in zip(labels, keys)})
+
+# Panel of the key figures of the compared datasets (one column per dataset)
+@panel('key_figures')
+def key_figures_comparison_panel(key_figures):
+    st.markdown("#### Key figures")
+    st.dataframe(pd.DataFrame(key_figures))
+
+@panel('interactions')
+def interactions_comparison_panel(edge_type_dfs):
+    st.markdown("#### Interaction between users")
+    st.bar_chart(stack(edge_type_dfs), x="Type of interaction", y="Number of interactions", color="Dataset", horizontal=True, stack=False)
+
+@panel('priority')
+def priority_comparison_panel(priority_counts_dfs):
+    st.markdown("### Tweet priority")
+    st.bar_chart(stack(priority_counts_dfs), x='Priority', y='Count', color='Dataset', horizontal=True, stack=False)
+
+@panel('category')
+def category_comparison_panel(tweets_per_category_dfs):
+    st.markdown("### Tweet category")
+    # One column per dataset, the largest categories over all the datasets are kept and the others summed in one bar
+    categories = stack(tweets_per_category_dfs).pivot_table(index='Category', columns='Dataset', values='Number of Tweets', aggfunc='sum', fill_value=0)
+    # A dataset without categories has no column in the pivot table
+    labels = list(tweets_per_category_dfs)
+    categories = categories.reindex(columns=labels, fill_value=0).rename_axis(columns=None).reset_index()
+    st.bar_chart(top_n(categories, 'Category', labels), x='Category', y=labels, horizontal=True, stack=False)
+
+@panel('event_metrics')
+def sub_events_comparison_panel(event_metrics_dfs):
+    st.markdown("### Social activities based on sub-events")
+    metric = st.radio("Metric", ('Tweets', 'Retweets', 'Replies'), horizontal=True)
+    totals = stack(event_metrics_dfs).groupby(['Event Type', 'Dataset'], as_index=False)[metric].sum()
+    st.bar_chart(totals, x='Event Type', y=metric, color='Dataset', stack=False)
+
+@panel('time_series')
+def time_trends_comparison_panel(time_series):
+    st.markdown("### Time trends in social activities")
+    col_event, col_resolution = st.columns(2)
+    option = col_event.selectbox("Choose the sub-event", ('Bombing', 'Earthquake', 'Flood', 'Shooting', 'Typhoon', 'Wildfire'))
+    resolution = col_resolution.radio("Resolution", list(TIME_RESOLUTIONS), index=1, horizontal=True)
+    # Collections of different years are compared on the time since their first tweet
+    align = st.checkbox("Align the datasets on their first tweet")
+    x = 'Days since the first tweet' if align else 'Date'
+    lines = []
+    for label, series in time_series.items():
+        tweet_dates_df = downsample(select_tweets_over_time(series, option.lower(), resolution), 'Date', 'Count')
+        tweet_dates_df[x] = (tweet_dates_df['Date'] - tweet_dates_df['Date'].min()) / pd.Timedelta(days=1) if align else tweet_dates_df['Date']
+        lines.append(tweet_dates_df.assign(Dataset=label))
+
+    st.markdown(f'''##### Number of tweets over time for {option.lower()}''')
+    import plotly.express as px
+    fig = px.line(pd.concat(lines, ignore_index=True), x=x, y='Count', color='Dataset', labels={'Count': "Number of tweets"})
+    st.plotly_chart(fig)
+
+# Panel of the interactions of the users of the compared datasets: the reciprocity of each dataset, and the users of all
+# the datasets in one table
+@panel('user_interactions')
+def user_interactions_comparison_panel(user_interactions):
+    st.markdown("### Interactions of the users")
+    st.write("Retweets, replies and mentions given and received by each user of every dataset, the reciprocity (share of the partners who interact back) and the retweet cascade (retweets received, plus the retweets of the users who retweeted them).")
+    for column, (label, interactions) in zip(st.columns(len(user_interactions)), user_interactions.items()):
+        column.metric(f"Reciprocity ({label})", f"{interactions['reciprocity']:.1%}")
+    users_df = stack({label: interactions['users'] for label, interactions in user_interactions.items()})
+    col_sort, col_page = st.columns([3, 1])
+    metrics = list(users_df.columns.drop(['User ID', 'User', 'Dataset']))
+    sort_by = col_sort.selectbox("Sort by", metrics, index=metrics.index('Retweet cascade'), key='compared_interactions_sort')
+    pages = num_pages(users_df)
+    page = col_page.number_input("Page", min_value=1, max_value=pages, value=1, key='compared_interactions_page')
+    st.dataframe(sort_page(users_df, sort_by, page=page), hide_index=True,
+        column_order=['Dataset'] + list(users_df.columns.drop('Dataset')),
+        column_config={
+            "Reciprocity": st.column_config.ProgressColumn(
+                "Reciprocity",
+                format="%.2f",
+                min_value=0,
+                max_value=1,
+            )}
+        )
+
+# Panel of the central users of the compared datasets: the top users of each dataset on the chosen criteria
+@panel('central_users')
+def central_users_comparison_panel(top_users):
+    st.markdown("#### Central users")
+    # criteria -> (ranking, column of the ranking, title of the column)
+    criteria = {
+        "Ability to connect users": ('connect', 'betweenness_centrality', "Betweenness Centrality"),
+        "Ability to spread information": ('spread', 'nombre_de_fois_retweete', "Number of times retweeted"),
+        "Ability to gather information": ('gather', 'degree_centrality', "Degree Centrality"),
+    }
+    option = st.selectbox("Choose the criteria", list(criteria), key='compared_central_criteria')
+    ranking, column, title = criteria[option]
+    rankings = stack({label: users[ranking] for label, users in top_users.items()})
+    if rankings.empty:
+        st.info("There are no users in these graphs.")
+        return
+    rankings['Rank'] = rankings.groupby('Dataset', sort=False).cumcount() + 1
+    st.dataframe(rankings,
+        column_order=("Dataset", "Rank", "user", column),
+        hide_index=True,
+        column_config={
+            "user": st.column_config.TextColumn(
+                "User ID",
+            ),
+            column: st.column_config.ProgressColumn(
+                title,
+                format="%f",
+                min_value=0,
+                max_value=max(rankings[column]),
+            )}
+        )
+
+# Panel of the activity of the users of the compared datasets: the average activity of a user of each dataset, and the
+# users of all the datasets in one table sorted on the server
+@panel('user_activity')
+def user_activity_comparison_panel(user_activity_dfs):
+    st.markdown("#### User activity")
+    averages = pd.DataFrame({label: df.drop(columns=['User ID', 'User']).mean() for label, df in user_activity_dfs.items()})
+    labels = list(user_activity_dfs)
+    averages = averages.fillna(0).rename_axis('Activity').reset_index()  # a dataset without users has no average
+    st.bar_chart(averages, x='Activity', y=labels, horizontal=True, stack=False, y_label="Average per user")
+    users_df = stack(user_activity_dfs)
+    col_sort, col_order, col_page = st.columns([2, 1, 1])
+    columns = list(users_df.columns.drop(['User ID', 'Dataset']))
+    sort_by = col_sort.selectbox("Sort by", columns, index=len(columns) - 1, key='compared_activity_sort')
+    ascending = col_order.radio("Order", ("Descending", "Ascending"), key='compared_activity_order') == "Ascending"
+    pages = num_pages(users_df)
+    page = col_page.number_input("Page", min_value=1, max_value=pages, value=1, key='compared_activity_page')
+    st.dataframe(sort_page(users_df, sort_by, ascending, page), hide_index=True,
+                 column_order=['Dataset'] + list(users_df.columns.drop('Dataset')))
+    st.caption(f"{len(users_df)} users, page {page} of {pages} ({PAGE_SIZE} users per page)")
+
+# Progress of the background loading of a graph: share of the file read, key figures of the part read so far, and
+# a button to cancel. The full page is drawn again once the graph tables are ready.
+@st.fragment(run_every=0.5)
+def loading_panel(loader):
+    if loader.tables is not None or not loader.running:
+        st.rerun()
+    st.progress(loader.progress(), text=f"{loader.stage}... ({loader.progress():.0%} of {loader.size / 1024 ** 2:.1f} MB)")
+    columns = st.columns(5)
+    for column, (label, value) in zip(columns, loader.partial_key_figures().items()):
+        column.metric(label, str(value), border=True)
+    if st.button("Cancel"):
+        loader.cancel()
+        st.rerun()
+
+# Refresh of the page while the background loader computes the datasets: the page is drawn again each time datasets
+# are ready (`shown` are the datasets that were pending when the page was drawn)
+@st.fragment(run_every=1)
+def refresh_when_ready(data, shown):
+    if data.pending != shown:
+        st.rerun()
+    st.caption(f"{data.loader.stage}...")
+
+# The run of the page. A profile started for it is stopped when the run ends, also when it stops early (st.stop,
+# st.rerun) or fails, so that the profiler does not stay enabled on the script thread.
+try:
+    if st.sidebar.toggle("Compare datasets", help="Upload several GraphML files (or snapshots) to compare them panel by panel."):
+        uploaded_files = st.file_uploader("Choose the files to compare (GraphML, or snapshots made with precompute.py)", type=['graphml', SNAPSHOT_EXTENSION], accept_multiple_files=True)
+        if not uploaded_files:
+            st.stop()
+        data = compared_datasets(uploaded_files)
+
+        key_figures_comparison_panel(data)
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            interactions_comparison_panel(data)
+            priority_comparison_panel(data)
+            category_comparison_panel(data)
+        with col2:
+            sub_events_comparison_panel(data)
+            time_trends_comparison_panel(data)
+            user_interactions_comparison_panel(data)
+        with col3:
+            central_users_comparison_panel(data)
+            user_activity_comparison_panel(data)
+
+        if diagnostics is not None:
+            show_diagnostics(diagnostics)
+        st.stop()
+
+    uploaded_file = st.file_uploader("Choose a file (GraphML, or a snapshot made with precompute.py)", type=['graphml', SNAPSHOT_EXTENSION], accept_multiple_files=False)
+    if uploaded_file is not None:
+        if uploaded_file.name.endswith('.' + SNAPSHOT_EXTENSION):
+            # Datasets precomputed offline: the dashboard only renders them
+            try:
+                with measure('load_snapshot'):
+                    data = load_snapshot(uploaded_file.getvalue())
+            except ValueError as error:
+                st.error(str(error))
+                st.stop()
+        elif BACKENDS[backend] is not None:
+            # Datasets queried from the database of the graph (the graph algorithms run on the edges read from it)
+            with st.spinner("Loading the graph into the database..."), measure('load_sql_graph'):
+                sql_graph = load_sql_graph(uploaded_file.getvalue(), BACKENDS[backend], content_key=file_hash(uploaded_file))
+            data = SqlDatasets(sql_graph)
+        else:
+            # The graph is read in a background thread (one loader per uploaded content in the session)
+            loader = st.session_state.get('loader')
+            if loader is None or loader.key != file_hash(uploaded_file):
+                if loader is not None:
+                    loader.cancel()
+                loader = st.session_state.loader = BackgroundLoader(uploaded_file.getvalue(), diagnostics, file_hash(uploaded_file))
+            if loader.error is not None:
+                st.error(f"The graph could not be loaded: {loader.error}")
+                del st.session_state.loader
+                st.stop()
+            if loader.tables is None:
+                if loader.cancelled and not loader.running:
+                    st.warning("Loading cancelled.")
+                    if st.button("Load again"):
+                        del st.session_state.loader
+                        st.rerun()
+                else:
+                    loading_panel(loader)
+                st.stop()
+            G = loader.tables
+            # Datasets computed by the loader, the light ones first (a panel is drawn once its datasets are ready)
+            data = BackgroundDatasets(loader)
+
+            # Delta files of new nodes and edges, applied to the maintained datasets instead of reloading the whole graph
+            deltas = st.file_uploader("Add delta files (GraphML of the new nodes and edges, applied once each in upload order)", type=['graphml'], accept_multiple_files=True)
+            if deltas:
+                graph_key = file_hash(uploaded_file)
+                if st.session_state.get('incremental_graph') != graph_key:
+                    with st.spinner("Preparing the incremental updates..."), measure('IncrementalDatasets'):
+                        st.session_state.incremental = IncrementalDatasets(G)
+                    st.session_state.incremental_graph = graph_key
+                data = st.session_state.incremental
+                for delta in deltas:
+                    delta_key = file_hash(delta)
+                    if delta_key not in data.applied:
+                        try:
+                            with st.spinner(f"Applying {delta.name}..."), measure('apply delta'):
+                                num_nodes, num_edges = data.apply(io.BytesIO(delta.getvalue()))
+                        except (ParseError, ValueError) as error:
+                            # Nothing of the delta was applied, and the next deltas may depend on it
+                            st.error(f"{delta.name} could not be applied: {error}")
+                            break
+                        data.applied.add(delta_key)
+                        st.toast(f"{delta.name}: {num_nodes} nodes and {num_edges} edges added")
+
+        # Dashboard visuals start here
+
+        # Key figures to describe the data
+        node, edges, tweets, users, hashtags = st.columns(5)
+        for column, (label, value) in zip((node, edges, tweets, users, hashtags), data['key_figures'].items()):
+            column.metric(label, str(value), border=True)
+
+        # Divide in columns (the lightest panels first, the heavy ones fill in afterwards)
+        col1, col2, col3 = st.columns([1, 2, 1])
+
+        with col1:
+            interactions_panel(data)
+            priority_panel(data)
+            category_panel(data)
+
+        with col2:
+            sub_events_panel(data)
+            time_trends_panel(data)
+            user_interactions_panel(data)
+
+        with col3:
+            central_users_panel(data)
+            user_activity_panel(data)
+
+        if getattr(data, 'pending', None):
+            refresh_when_ready(data, data.pending)
+
+        if diagnostics is not None:
+            show_diagnostics(diagnostics)
+
+    else:
+        st.stop()
+finally:
+    if diagnostics is not None:
+        diagnostics.stop_profile()
 
 
 # ================================ CODE DUMP ================================
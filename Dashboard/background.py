@@ -0,0 +1,130 @@
+import io
+import threading
+from collections import Counter
+
+from datasets import DATASETS, LazyDatasets
+from diagnostics import activate, measure
+from graph_cache import content_hash, graph_cache
+from graph_tables import EDGE_ATTRIBUTES, NODE_ATTRIBUTES, TablesBuilder
+from graphml_stream import iter_graphml
+from parallel import prefetch_aggregates
+
+'''This file contains the background loading of an uploaded graph: a thread streams the GraphML into the graph tables,
+publishing its progress and the running key figures, then computes the datasets of the panels, the light ones first.
+The page stays responsive while the graph is read, and the loading can be cancelled between two batches. For large
+graphs, the aggregates are first computed together in parallel worker processes.'''
+
+# Order in which the datasets of the panels are computed once the graph is loaded
+DATASET_ORDER = ('key_figures', 'priority', 'category', 'interactions', 'event_metrics', 'time_series',
+                 'user_activity', 'user_interactions', 'central_users')
+
+# Number of nodes or edges read between two updates of the progress (and two checks of a cancellation)
+PROGRESS_BATCH_SIZE = 10_000
+
+LABELS = NODE_ATTRIBUTES.index('labels')
+
+class LoadingCancelled(Exception):
+    pass
+
+# Loader of an uploaded graph in a background thread (started when it is created)
+class BackgroundLoader:
+    def __init__(self, data, diagnostics=None, key=None):
+        self.key = key or content_hash(data)
+        self.size = len(data)
+        self.stage = "Reading the graph"
+        self.tables = None  # graph tables, once the graph is read
+        self.computed = set()  # names of the datasets computed so far
+        self.error = None
+        self.num_nodes = 0
+        self.num_edges = 0
+        self.node_counts = Counter()  # node label -> number of nodes read so far
+        self._source = io.BytesIO(data)
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(diagnostics,), name='graph-loader', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    # Share of the file read so far
+    def progress(self):
+        source = self._source
+        if self.tables is not None or source is None:
+            return 1.0
+        return min(source.tell() / max(self.size, 1), 1.0)
+
+    # Key figures of the part of the graph read so far
+    def partial_key_figures(self):
+        return {
+            'Number of nodes': self.num_nodes,
+            'Number of edges': self.num_edges,
+            'Number of tweets': self.node_counts[':Tweet'],
+            'Number of users': self.node_counts[':User'],
+            'Number of hashtags': self.node_counts[':Hashtag'],
+        }
+
+    def _check_cancelled(self):
+        if self._cancel.is_set():
+            raise LoadingCancelled()
+
+    def _read(self):
+        builder = TablesBuilder()
+        for kind, records in iter_graphml(self._source, NODE_ATTRIBUTES, EDGE_ATTRIBUTES, PROGRESS_BATCH_SIZE):
+            self._check_cancelled()
+            if kind == 'nodes':
+                builder.add_nodes(records)
+                self.node_counts.update(values[LABELS] for _, values in records)
+                self.num_nodes = len(builder.node_keys)
+            else:
+                builder.add_edges(records)
+                self.num_edges = len(builder.sources)
+        self.stage = "Building the tables"
+        return builder.build()
+
+    def _run(self, diagnostics):
+        activate(diagnostics)
+        try:
+            tables = graph_cache.get(self.key)
+            if tables is None:
+                with measure('read_graph_tables'):
+                    tables = self._read()
+                graph_cache.put(self.key, tables)
+            self._source = None
+            self.tables = tables
+            self._check_cancelled()
+            self.stage = "Computing the aggregates"
+            prefetch_aggregates(tables)
+            for name in DATASET_ORDER:
+                self._check_cancelled()
+                self.stage = f"Computing {name.replace('_', ' ')}"
+                DATASETS[name](tables)
+                self.computed.add(name)
+            self.stage = "Done"
+        except LoadingCancelled:
+            self.stage = "Cancelled"
+        except Exception as error:
+            self.error = error
+        finally:
+            self._source = None
+
+
+# Datasets of a graph loaded in the background: `pending` lists the datasets the loader is still to compute
+# (once the loader has stopped, the remaining datasets are computed when a panel first needs them)
+class BackgroundDatasets(LazyDatasets):
+    def __init__(self, loader):
+        super().__init__(loader.tables)
+        self.loader = loader
+
+    @property
+    def pending(self):
+        if not self.loader.running:
+            return set()
+        return set(DATASET_ORDER) - self.loader.computed
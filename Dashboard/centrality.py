@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from parallel import process_pool
+from utils import graph_index, interaction_graph, per_graph
+
+'''This file contains the computation of the central users of the graph (top users for the "Central users" panel)'''
+
+# Number of users shown for each criteria
+TOP_USERS = 10
+
+# Edges used for the degree centrality (ability to gather information)
+GATHER_INFORMATION = ('POSTED', 'MENTIONS', 'REPLIED_TO')
+
+# Number of pivots sampled to approximate the betweenness centrality, and seed of the sampling
+BETWEENNESS_PIVOTS = 256
+BETWEENNESS_SEED = 42
+
+# Function to accumulate the betweenness of the shortest paths starting from some pivots (run in a worker process).
+# The graph is sent as the arrays of its edges between the users 0..n-1, smaller to pickle than a NetworkX graph.
+def _betweenness_from_pivots(n, rows, cols, pivots):
+    import networkx as nx  # imported on first use, the landing page of the dashboard does not need it
+    H = nx.Graph()
+    H.add_nodes_from(range(n))
+    H.add_edges_from(zip(rows.tolist(), cols.tolist()))
+    return nx.betweenness_centrality_subset(H, sources=pivots.tolist(), targets=list(H), normalized=False)
+
+# Function to approximate the normalized betweenness centrality of the users of an InteractionGraph (undirected) with
+# k sampled pivots, spread over a process pool (returns one value per user, in the order of graph.users)
+def approximate_betweenness(graph, k=BETWEENNESS_PIVOTS, seed=BETWEENNESS_SEED, max_workers=None):
+    n = len(graph.users)
+    if n <= 2:
+        return np.zeros(n)
+    pairs = graph.combined().tocoo()
+    k = min(k, n)
+    pivots = np.random.default_rng(seed).choice(n, size=k, replace=False)
+    chunks = [chunk for chunk in np.array_split(pivots, max_workers or os.cpu_count() or 1) if len(chunk)]
+
+    if len(chunks) == 1:
+        partials = [_betweenness_from_pivots(n, pairs.row, pairs.col, chunks[0])]
+    else:
+        with process_pool(len(chunks)) as pool:
+            count = len(chunks)
+            partials = list(pool.map(_betweenness_from_pivots, [n] * count, [pairs.row] * count, [pairs.col] * count, chunks))
+    betweenness = pd.DataFrame(partials).sum().reindex(range(n), fill_value=0.0).to_numpy()
+
+    # betweenness_centrality_subset halves the sums of an undirected graph, then the k pivots are scaled to n sources
+    return betweenness * 2 * n / (k * (n - 1) * (n - 2))
+
+# Users tied at the last place are ranked by name, so that the ranking does not depend on the order of the nodes
+# (which differs between the backends, e.g. in a graph updated with deltas)
+def _top_users(names, values, column):
+    ranking = pd.DataFrame({'user': names, column: values}).nlargest(TOP_USERS, column, keep='all')
+    ranking = ranking.sort_values([column, 'user'], ascending=[False, True], kind='stable')
+    return ranking.head(TOP_USERS).reset_index(drop=True)
+
+# Function to rank the users on the three criteria of the "Central users" panel (computed once per graph)
+@per_graph
+def central_users(G):
+    index = graph_index(G)
+    users = index.node_codes(':User')
+    n = G.number_of_nodes()
+
+    # Ability to gather information: degree centrality on the POSTED, MENTIONS and REPLIED_TO edges
+    degree = np.zeros(n, dtype=np.int64)
+    touched = np.zeros(n, dtype=bool)
+    for label in GATHER_INFORMATION:
+        for codes in index.edges(label):
+            degree += np.bincount(codes, minlength=n)
+            touched[codes] = True
+    degree_centrality = degree[users] / max(touched.sum() - 1, 1)
+
+    # Ability to spread information: number of times the user has been retweeted
+    retweeted = np.bincount(index.edges('RETWEETS')[1], minlength=n)[users]
+
+    return rank_central_users(G.node_values('name', users), degree_centrality, retweeted, interaction_graph(G))
+
+# Function to rank the users on the three criteria from their degree centrality, the number of times they have been
+# retweeted and their graph of interactions (`names`, `degree_centrality` and `retweeted` follow graph.users)
+def rank_central_users(names, degree_centrality, retweeted, graph):
+    # Ability to connect users: approximate betweenness centrality in the graph of the interactions between users
+    betweenness = approximate_betweenness(graph)
+
+    return {
+        'connect': _top_users(names, betweenness, 'betweenness_centrality'),
+        'spread': _top_users(names, retweeted, 'nombre_de_fois_retweete'),
+        'gather': _top_users(names, degree_centrality, 'degree_centrality'),
+    }
@@ -0,0 +1,61 @@
+from collections.abc import Mapping
+
+import pandas as pd
+
+from centrality import central_users
+from parallel import compute_aggregates
+from utils import per_graph, edge_type_counts, event_metrics, key_figures, tweet_time_series, tweets_per_category, tweets_per_priority, user_activity, user_interactions
+
+'''This file lists the datasets displayed by the panels of the dashboard, and computes them from a graph'''
+
+# Function to get the number of tweets per priority as a table
+@per_graph
+def priority_counts_df(G):
+    return pd.DataFrame(tweets_per_priority(G).items(), columns=['Priority', 'Count'])
+
+# Datasets of the panels: name -> function of the graph
+DATASETS = {
+    'key_figures': key_figures,
+    'interactions': edge_type_counts,
+    'priority': priority_counts_df,
+    'category': tweets_per_category,
+    'event_metrics': event_metrics,
+    'time_series': tweet_time_series,
+    'central_users': central_users,
+    'user_activity': user_activity,
+    'user_interactions': user_interactions,
+}
+
+# Function to compute the datasets of all the panels of the dashboard
+def dashboard_datasets(G, names=tuple(DATASETS)):
+    compute_aggregates(G)
+    return {name: DATASETS[name](G) for name in names}
+
+# Datasets of a graph, each one computed on first access (and then memoized with the graph)
+class LazyDatasets(Mapping):
+    def __init__(self, G):
+        self.G = G
+
+    def __getitem__(self, name):
+        return DATASETS[name](self.G)
+
+    def __iter__(self):
+        return iter(DATASETS)
+
+    def __len__(self):
+        return len(DATASETS)
+
+# Datasets of several graphs compared side by side: each dataset is {graph label: value of the dataset for the graph}
+# (every graph keeps its own datasets, computed and memoized independently)
+class ComparedDatasets(Mapping):
+    def __init__(self, datasets):
+        self.datasets = datasets  # graph label -> datasets of the graph
+
+    def __getitem__(self, name):
+        return {label: data[name] for label, data in self.datasets.items()}
+
+    def __iter__(self):
+        return iter(DATASETS)
+
+    def __len__(self):
+        return len(DATASETS)
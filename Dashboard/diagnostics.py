@@ -0,0 +1,157 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+'''This file contains the instrumentation of the dashboard. When diagnostics are on, the time and memory of every
+stage (loading the graph, computing each aggregate, rendering each panel) are recorded, and a run can be profiled.
+The records can be exported as JSON, and the profiles as a cProfile dump (or a pyinstrument page if it is installed).
+
+Stages are measured with measure(name); nothing is recorded when no Diagnostics object is active.'''
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILERS = ('cProfile', 'pyinstrument') if pyinstrument is not None else ('cProfile',)
+
+_MB = 1024 ** 2
+
+# Highest resident memory of the process since it started (it never goes down)
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+# Current resident memory of the process (None where /proc is not available)
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * resource.getpagesize() / _MB
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Recorded stages and profile of a dashboard session
+class Diagnostics:
+    def __init__(self, track_allocations=False):
+        self.track_allocations = track_allocations
+        self.stages = []
+        self.profile = None  # (profiler name, cProfile profiler or pyinstrument page) of the last profiled run
+        self._profiler = None
+        self._local = threading.local()  # stages are measured in the script thread and in the background loader
+
+    @property
+    def _peaks(self):
+        # Peak of traced memory seen by each open stage of the current thread (tracemalloc has a single peak)
+        if not hasattr(self._local, 'peaks'):
+            self._local.peaks = []
+        return self._local.peaks
+
+    def clear(self):
+        self.stages = []
+        self.profile = None
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        allocations = self.track_allocations
+        if allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(current)
+        rss = _rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            # The change of the resident memory includes what the other threads (panels, loader) did meanwhile
+            rss_after = _rss_mb()
+            stage = {'stage': name, 'seconds': seconds, 'process_max_rss_mb': _max_rss_mb(), 'time': time.time(),
+                     'rss_change_mb': None if rss is None or rss_after is None else rss_after - rss}
+            if allocations:
+                after, peak = tracemalloc.get_traced_memory()
+                peak = max(self._peaks.pop(), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                stage['allocated_mb'] = (after - current) / _MB  # memory still held at the end of the stage
+                stage['peak_allocated_mb'] = (peak - current) / _MB
+            self.stages.append(stage)
+
+    def summary(self):
+        stages = pd.DataFrame(self.stages)
+        if stages.empty:
+            return stages
+        columns = {'seconds': ('seconds', 'sum'), 'calls': ('seconds', 'size'), 'rss_change_mb': ('rss_change_mb', 'max'),
+                   'process_max_rss_mb': ('process_max_rss_mb', 'max')}
+        if 'peak_allocated_mb' in stages:
+            columns['peak_allocated_mb'] = ('peak_allocated_mb', 'max')
+        summary = stages.groupby('stage', sort=False).agg(**columns)
+        return summary.sort_values('seconds', ascending=False).reset_index()
+
+    def to_json(self):
+        return json.dumps({'stages': self.stages}, indent=2)
+
+    def start_profile(self, profiler='cProfile'):
+        if profiler == 'pyinstrument':
+            profile = pyinstrument.Profiler()
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        self._profiler = (profiler, profile)
+
+    def stop_profile(self):
+        if self._profiler is None:
+            return
+        name, profiler = self._profiler
+        self._profiler = None
+        if name == 'pyinstrument':
+            profiler.stop()
+            self.profile = (name, profiler.output_html())
+        else:
+            profiler.disable()
+            self.profile = (name, profiler)
+
+    # Function to export the last profile: (file name, content as bytes), None if no run was profiled
+    def profile_dump(self):
+        if self.profile is None:
+            return None
+        name, result = self.profile
+        if name == 'pyinstrument':
+            return 'dashboard-profile.html', result.encode('utf-8')
+        return 'dashboard.prof', marshal.dumps(pstats.Stats(result).stats)  # same format as pstats.Stats.dump_stats
+
+    def profile_text(self, limit=25):
+        if self.profile is None or self.profile[0] != 'cProfile':
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profile[1], stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+
+_active = contextvars.ContextVar('diagnostics', default=None)
+
+# Function to record the stages measured from now on in a Diagnostics object (None to stop recording)
+def activate(diagnostics):
+    _active.set(diagnostics)
+
+@contextlib.contextmanager
+def measure(name):
+    diagnostics = _active.get()
+    if diagnostics is None:
+        yield
+    else:
+        with diagnostics.measure(name):
+            yield
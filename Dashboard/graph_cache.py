@@ -0,0 +1,135 @@
+import hashlib
+import io
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from diagnostics import measure
+from graph_tables import TABLES_VERSION, read_graph_tables
+from parallel import process_pool
+
+'''This file contains the cache of the parsed graphs, keyed by a hash of the content of the uploaded file'''
+
+# Folder of the cache on disk (can be moved with the DASHBOARD_CACHE_DIR environment variable)
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.graph_cache'))
+
+# Total size of the graphs kept in memory and of the files kept on disk. The memory counted is the size of the graph
+# tables: the datasets memoized with a graph (utils.per_graph) are kept alive with it and come on top of this bound.
+MAX_MEMORY_BYTES = 1024 ** 3
+MAX_DISK_BYTES = 2 * 1024 ** 3
+
+# Function to compute the key of an uploaded file
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# LRU cache of graph tables: in memory first, then pickled on disk
+class GraphCache:
+    def __init__(self, directory=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (tables, size in memory)
+        self._lock = threading.RLock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.v{TABLES_VERSION}.pickle')
+
+    # Tables of a key (None if they are not cached), kept in memory unless `remember` is False
+    def get(self, key, remember=True):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as file:
+                    tables = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                return None
+            os.utime(path)  # the modification time is used as the last access time on disk
+            if remember:
+                self._remember(key, tables)
+            return tables
+
+    def put(self, key, tables, remember=True):
+        with self._lock:
+            if remember:
+                self._remember(key, tables)
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            with open(path + '.tmp', 'wb') as file:
+                pickle.dump(tables, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            self._evict_disk()
+
+    # The least recently used graphs are dropped once the graphs in memory exceed max_memory_bytes (the last graph is
+    # always kept, even if it is larger on its own)
+    def _remember(self, key, tables):
+        self._memory[key] = (tables, tables.memory_usage())
+        self._memory.move_to_end(key)
+        total = sum(size for _, size in self._memory.values())
+        while total > self.max_memory_bytes and len(self._memory) > 1:
+            _, (_, size) = self._memory.popitem(last=False)
+            total -= size
+
+    def _evict_disk(self):
+        evict_disk(self.directory, self.max_disk_bytes)
+
+    # Function to load several files at once: the files that are not cached are parsed in parallel worker processes
+    # (`keys` are the content hashes of the datas, when the caller already knows them)
+    def load_many(self, datas, remember=True, max_workers=None, keys=None):
+        keys = keys or [content_hash(data) for data in datas]
+        graphs = {key: self.get(key, remember) for key in keys}
+        missing = {key: data for key, data in zip(keys, datas) if graphs[key] is None}
+        workers = min(len(missing), max_workers or os.cpu_count() or 1)
+        with measure('read_graph_tables'):
+            if workers > 1:
+                with process_pool(workers) as pool:
+                    parsed = dict(zip(missing, pool.map(_read_graph_tables, missing.values())))
+            else:
+                parsed = {key: _read_graph_tables(data) for key, data in missing.items()}
+        for key, tables in parsed.items():
+            self.put(key, tables, remember)
+            graphs[key] = tables
+        return [graphs[key] for key in keys]
+
+
+# Function to remove the least recently used files of the cache folder once they exceed max_disk_bytes: the pickled
+# tables and the databases of the SQL backend (a database and its write-ahead log go together). The most recent file
+# is kept, the files being written are skipped, and so are the files that cannot be removed while they are open.
+def evict_disk(directory=CACHE_DIR, max_disk_bytes=MAX_DISK_BYTES):
+    entries = {}
+    for name in os.listdir(directory):
+        if '.tmp' in name:
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue  # removed in the meantime
+        entry = name.removesuffix('.wal')
+        last_used, size, names = entries.get(entry, (0.0, 0, []))
+        entries[entry] = (max(last_used, stat.st_mtime), size + stat.st_size, names + [name])
+    total = sum(size for _, size, _ in entries.values())
+    for _, size, names in sorted(entries.values())[:-1]:
+        if total <= max_disk_bytes:
+            break
+        try:
+            for name in names:
+                os.remove(os.path.join(directory, name))
+        except OSError:
+            continue
+        total -= size
+
+
+# Function run in the worker processes of load_many
+def _read_graph_tables(data):
+    return read_graph_tables(io.BytesIO(data))
+
+
+graph_cache = GraphCache()
+
+# Function to load the graphs of several uploaded files, each one parsed only the first time its content is seen
+# (with remember=False they are not kept in the memory cache, e.g. when the caller keeps its own copy)
+def load_graphs(datas, remember=True, keys=None):
+    return graph_cache.load_many(datas, remember, keys=keys)
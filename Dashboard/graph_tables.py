@@ -0,0 +1,218 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from graphml_stream import iter_graphml
+
+try:
+    import pyarrow  # noqa: F401 (installed with Streamlit)
+    STRING_DTYPE = pd.StringDtype('pyarrow')
+except ImportError:
+    STRING_DTYPE = None
+
+'''This file contains the columnar representation of the graph used by the dashboard (one table for the nodes, one for the edges)'''
+
+# Node attributes read by the dashboard, the other attributes of the GraphML are dropped
+NODE_ATTRIBUTES = ('labels', 'id', 'name', 'eventType', 'created_at', 'annotation_postPriority')
+
+# Edge attributes read by the dashboard
+EDGE_ATTRIBUTES = ('label',)
+
+# Attributes with few distinct values, stored as pandas categoricals
+CATEGORICAL_NODE_ATTRIBUTES = ('labels', 'eventType', 'annotation_postPriority')
+
+# Attributes stored as dates (datetime64, in UTC), parsed once when the graph is loaded
+DATETIME_NODE_ATTRIBUTES = ('created_at',)
+
+# Version of the layout and parsing of the tables (part of the key of the graphs cached on disk)
+TABLES_VERSION = 3
+
+# Columnar graph: nodes are numbered 0..n-1 (node codes) and edges refer to them by code. The attributes are typed
+# columns: categorical codes for the labels and priorities, datetime64 for the dates, and Arrow strings (one buffer
+# per column instead of one Python object per value) for the ids and names when pyarrow is installed.
+class GraphTables:
+    __slots__ = ('nodes', 'edges', '__weakref__')
+
+    def __init__(self, nodes, edges):
+        self.nodes = nodes  # index = node code, columns = 'node' (GraphML id) + NODE_ATTRIBUTES
+        self.edges = edges  # columns = 'source', 'target' (node codes) and 'label'
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.edges)
+
+    # Values of a node attribute for some node codes (all the nodes by default), as objects with None when missing
+    def node_values(self, attribute, codes=None):
+        values = self.nodes[attribute]
+        if codes is not None:
+            values = values.take(codes)
+        return values.to_numpy(dtype=object, na_value=None)
+
+    def memory_usage(self):
+        return int(self.nodes.memory_usage(deep=True).sum() + self.edges.memory_usage(deep=True).sum())
+
+
+def _int32(values):
+    return np.frombuffer(values, dtype=np.int32).copy() if len(values) else np.empty(0, dtype=np.int32)
+
+def _strings(values):
+    values = pd.Series(values, dtype=object)
+    if STRING_DTYPE is not None and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        return values.astype(STRING_DTYPE)
+    return values  # no pyarrow, or values of another type (e.g. ids declared as long in the GraphML)
+
+def _datetimes(values):
+    dates = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601')
+    return dates.dt.tz_convert(None)
+
+# Column stored as integer codes into the dictionary of its distinct values (-1 for a missing value)
+class CodedColumn:
+    def __init__(self):
+        self.codes = array('i')
+        self.values = {}
+        self.categories = []
+
+    def _code(self, value):
+        if value is None:
+            return -1
+        code = self.values.get(value)
+        if code is None:
+            code = self.values[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self._code(value))
+
+    def __getitem__(self, position):
+        code = self.codes[position]
+        return None if code < 0 else self.categories[code]
+
+    def __setitem__(self, position, value):
+        self.codes[position] = self._code(value)
+
+    def to_categorical(self):
+        return pd.Categorical.from_codes(_int32(self.codes), categories=self.categories)
+
+
+# Builder of the node and edge tables, filled node by node and edge by edge (or batch by batch)
+class TablesBuilder:
+    def __init__(self):
+        self.codes = {}
+        self.node_keys = []
+        self.node_columns = {attribute: CodedColumn() if attribute in CATEGORICAL_NODE_ATTRIBUTES else []
+                             for attribute in NODE_ATTRIBUTES}
+        self.sources = array('i')
+        self.targets = array('i')
+        self.edge_labels = CodedColumn()
+
+    # Code of a node, the node is added without attributes the first time it is seen (as NetworkX does for edges)
+    def node_code(self, key):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.node_keys)
+            self.node_keys.append(key)
+            for column in self.node_columns.values():
+                column.append(None)
+        return code
+
+    # Add a node, or update the attributes it is given if it is already there (as NetworkX does)
+    def add_node(self, key, values):
+        code = self.node_code(key)
+        for attribute, value in zip(NODE_ATTRIBUTES, values):
+            if value is not None:
+                self.node_columns[attribute][code] = value
+        return code
+
+    def add_edge(self, source, target, label):
+        self.sources.append(self.node_code(source))
+        self.targets.append(self.node_code(target))
+        self.edge_labels.append(label)
+
+    def add_nodes(self, records):
+        for key, values in records:
+            self.add_node(key, values)
+
+    def add_edges(self, records):
+        for source, target, (label,) in records:
+            self.add_edge(source, target, label)
+
+    def build(self):
+        nodes = pd.DataFrame({'node': _strings(self.node_keys)})
+        for attribute, column in self.node_columns.items():
+            if isinstance(column, CodedColumn):
+                nodes[attribute] = column.to_categorical()
+            elif attribute in DATETIME_NODE_ATTRIBUTES:
+                nodes[attribute] = _datetimes(column)
+            else:
+                nodes[attribute] = _strings(column)
+        edges = pd.DataFrame({
+            'source': _int32(self.sources),
+            'target': _int32(self.targets),
+            'label': self.edge_labels.to_categorical(),
+        })
+        return GraphTables(nodes, edges)
+
+
+# Columns whose dictionaries are shared by the graphs of a comparison: the ids and names (users seen in several
+# collections) and the categorical attributes
+SHARED_COLUMNS = (('nodes', 'node'), ('nodes', 'id'), ('nodes', 'name')) + \
+    tuple(('nodes', attribute) for attribute in CATEGORICAL_NODE_ATTRIBUTES) + (('edges', 'label'),)
+
+def _factorize(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques)
+
+# Function to recode the string and categorical columns of several graphs in shared dictionaries: every distinct value
+# is stored once for all the graphs, each graph keeps int32 codes (returns new tables, in the order of the graphs)
+# `shared` are graphs already recoded by this function: their dictionaries are extended with the values of the new
+# graphs, and switched to in place (their codes do not change, so what was computed from them stays valid).
+def share_dictionaries(graphs, shared=()):
+    if not graphs:
+        return []
+    tables = [{'nodes': graph.nodes.copy(deep=False), 'edges': graph.edges.copy(deep=False)} for graph in graphs]
+    for table_name, column in SHARED_COLUMNS:
+        factorized = [_factorize(graph[table_name][column]) for graph in tables]
+        known = [getattr(graph, table_name)[column].cat.categories for graph in shared[:1]]
+        dictionaries = [values for values in known + [uniques for _, uniques in factorized] if len(values)] or [factorized[0][1]]
+        dictionary = dictionaries[0].append(dictionaries[1:]).drop_duplicates()  # the known values keep their position
+        dtype = pd.CategoricalDtype(dictionary)
+        for graph, (codes, uniques) in zip(tables, factorized):
+            positions = dictionary.get_indexer(uniques).astype(np.int32)
+            shared_codes = np.full(len(codes), -1, dtype=np.int32)  # missing values keep the code -1
+            shared_codes[codes >= 0] = positions[codes[codes >= 0]]
+            graph[table_name][column] = pd.Categorical.from_codes(shared_codes, dtype=dtype)
+        for graph in shared:
+            values = getattr(graph, table_name)
+            values[column] = pd.Categorical.from_codes(values[column].cat.codes.to_numpy(), dtype=dtype)
+        # The hash table of the dictionary (built to encode and to check the values are unique) is as large as the
+        # values themselves and is not needed to decode the codes: it is dropped, pandas rebuilds it if it is needed.
+        # It is kept in a private cache of pandas, so nothing is dropped if a version of pandas stores it elsewhere.
+        cache = getattr(dictionary, '_cache', None)
+        if isinstance(cache, dict):
+            cache.pop('_engine', None)
+    return [GraphTables(graph['nodes'], graph['edges']) for graph in tables]
+
+# Function to convert a NetworkX graph into node and edge tables
+def graph_to_tables(G):
+    builder = TablesBuilder()
+    for node, data in G.nodes(data=True):
+        builder.add_node(node, [data.get(attribute) for attribute in NODE_ATTRIBUTES])
+    for source, target, label in G.edges(data='label'):
+        builder.add_edge(source, target, label)
+    return builder.build()
+
+# Function to load a GraphML file (path or uploaded file) as node and edge tables, streaming the XML in batches
+def read_graph_tables(source):
+    builder = TablesBuilder()
+    for kind, records in iter_graphml(source, NODE_ATTRIBUTES, EDGE_ATTRIBUTES):
+        if kind == 'nodes':
+            builder.add_nodes(records)
+        else:
+            builder.add_edges(records)
+    return builder.build()
@@ -0,0 +1,83 @@
+from xml.etree.ElementTree import iterparse
+
+'''This file contains a streaming GraphML reader: nodes and edges are read in batches and the XML is freed as it goes'''
+
+BATCH_SIZE = 50_000
+
+# Conversion of the GraphML attribute types (same rules as NetworkX)
+GRAPHML_TYPES = {
+    'int': int,
+    'long': int,
+    'integer': int,
+    'float': float,
+    'double': float,
+    'boolean': lambda text: text.strip().lower() in ('true', '1'),
+}
+
+def _tag(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+# Function to read a <key> definition: (attribute name, conversion), or None if the attribute is not kept
+# (like NetworkX, the <default> values are not applied to the nodes and edges)
+def _read_key(element, wanted):
+    attribute = element.get('attr.name')
+    if attribute not in wanted.get(element.get('for', 'all'), ()):
+        return None
+    return attribute, GRAPHML_TYPES.get(element.get('attr.type', 'string'), str)
+
+# Function to read the values of the kept attributes of a node or an edge (in the order of the wanted attributes)
+def _read_values(element, keys, attributes):
+    values = {}
+    for data in element:
+        key = keys.get(data.get('key'))
+        if key is not None:
+            attribute, convert = key
+            values[attribute] = convert(data.text or '')
+    return tuple(values.get(attribute) for attribute in attributes)
+
+# Generator of the batches of a GraphML file: ('nodes', [(node id, values)]) and ('edges', [(source, target, values)])
+# Only the attributes listed in node_attributes / edge_attributes are kept, the other <data> elements are skipped.
+def iter_graphml(source, node_attributes, edge_attributes, batch_size=BATCH_SIZE):
+    wanted = {'node': set(node_attributes), 'edge': set(edge_attributes)}
+    wanted['all'] = wanted['node'] | wanted['edge']
+    keys = {}
+    nodes, edges = [], []
+    graph = None
+
+    for event, element in iterparse(source, events=('start', 'end')):
+        tag = _tag(element)
+        if event == 'start':
+            if tag == 'graph' and graph is None:
+                graph = element
+            continue
+
+        if tag == 'key':
+            key = _read_key(element, wanted)
+            if key is not None:
+                keys[element.get('id')] = key
+        elif tag == 'node':
+            nodes.append((element.get('id'), _read_values(element, keys, node_attributes)))
+            if len(nodes) >= batch_size:
+                yield 'nodes', nodes
+                nodes = []
+        elif tag == 'edge':
+            edges.append((element.get('source'), element.get('target'),
+                          _read_values(element, keys, edge_attributes)))
+            if len(edges) >= batch_size:
+                if nodes:
+                    yield 'nodes', nodes
+                    nodes = []
+                yield 'edges', edges
+                edges = []
+        else:
+            continue
+
+        # The element has been read: free it (and the references kept by its parent)
+        element.clear()
+        if graph is not None and tag != 'key':
+            graph.clear()
+
+    if nodes:
+        yield 'nodes', nodes
+    if edges:
+        yield 'edges', edges
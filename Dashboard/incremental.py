@@ -0,0 +1,300 @@
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from datasets import DATASETS
+from graph_tables import EDGE_ATTRIBUTES, NODE_ATTRIBUTES, TablesBuilder
+from graphml_stream import iter_graphml
+from utils import EVENT_INTERACTIONS, TIME_RESOLUTIONS, USER_ACTIVITY, USER_INTERACTIONS, as_tables
+
+'''This file contains the incremental mode of the dashboard: delta files (GraphML files of new nodes and edges) are
+applied to aggregates maintained with the graph, so that a refresh costs in proportion to the delta, not to the graph.
+
+The nodes of a delta that are already in the graph get the attributes they are given (as NetworkX does), its edges
+are added. The central users are not maintained: they are computed from the updated graph when they are displayed.'''
+
+# Datasets maintained by the deltas, the other datasets of the panels are computed from the updated graph
+MAINTAINED_DATASETS = ('key_figures', 'interactions', 'priority', 'category', 'event_metrics', 'time_series', 'user_activity')
+
+# Node labels whose nodes are listed in the datasets (one row per event, category or user)
+LISTED_LABELS = (':Event', ':PostCategory', ':User')
+
+ACTIVITY_COLUMNS = {label: column for column, label in enumerate(USER_ACTIVITY)}
+
+def _records(column):
+    # Values of a column of the tables as a list, with None for the missing values
+    return column.astype(object).where(column.notna(), None).tolist()
+
+def _parse_dates(values):
+    dates = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601')
+    return dates.dt.tz_convert(None).to_numpy()
+
+# Datasets of the panels of a graph, kept up to date as delta files are applied
+class IncrementalDatasets(Mapping):
+    def __init__(self, G):
+        G = as_tables(G)
+        self.builder = TablesBuilder()
+        self.applied = set()  # content hashes of the applied delta files (filled by the caller)
+
+        # Counters of the key figures, interactions, priorities and user activity
+        self.node_counts = Counter()  # node label -> number of nodes
+        self.edge_counts = Counter()  # edge label -> number of edges
+        self.priority_counts = Counter()  # priority -> number of tweets (in the order the priorities are seen)
+        self.members = {label: set() for label in LISTED_LABELS}  # node label -> node codes
+        self.activity = np.zeros((0, len(USER_ACTIVITY)), dtype=np.int64)  # node code -> USER_ACTIVITY edges it is the source of
+        self.dates = np.empty(0, dtype='datetime64[ns]')  # node code -> created_at
+
+        # IS_ABOUT / HAS_CATEGORY pairs and the interactions between tweets, with the event and category counts
+        self.events_of = defaultdict(list)  # tweet code -> event codes
+        self.tweets_of = defaultdict(list)  # event code -> tweet codes
+        self.interactions_of = defaultdict(list)  # tweet code -> (other tweet code, event metrics column)
+        self.event_counts = {'Tweets': Counter(), 'Retweets': Counter(), 'Replies': Counter()}  # column -> event code -> count
+        self.categorized = set()  # (tweet code, category code)
+        self.category_counts = Counter()  # category code -> number of tweets
+
+        # Time series: (tweet, event) pairs counted, and the number of tweets per resolution, level, key and period
+        self.timed = set()
+        self.typed = Counter()  # (tweet code, event type) -> number of counted events of that type
+        self.time_counts = {resolution: {'Event ID': defaultdict(Counter), 'Event Type': defaultdict(Counter)}
+                            for resolution in TIME_RESOLUTIONS}
+        self._time_changes = []
+        self._series = {resolution: {'Event ID': {}, 'Event Type': {}} for resolution in TIME_RESOLUTIONS}
+        self._stale_series = set()
+
+        # The aggregates of the graph are built by applying it as a first delta
+        nodes, edges = G.nodes, G.edges
+        keys = G.nodes['node'].tolist()
+        self._add_nodes(zip(keys, zip(*(_records(nodes[attribute]) for attribute in NODE_ATTRIBUTES))))
+        labels = zip(_records(edges['label']))
+        self._add_edges(zip(map(keys.__getitem__, edges['source'].tolist()), map(keys.__getitem__, edges['target'].tolist()), labels))
+        self._flush_time_changes()
+        self._tables = G
+        self._datasets = {}
+
+    # Function to apply a delta file (path or file object), returns its number of nodes and edges. The whole file is
+    # read before the datasets are updated, so a malformed delta (ParseError, ValueError) leaves them unchanged.
+    def apply(self, source):
+        batches = list(iter_graphml(source, NODE_ATTRIBUTES, EDGE_ATTRIBUTES))
+        num_nodes = num_edges = 0
+        for kind, records in batches:
+            if kind == 'nodes':
+                self._add_nodes(records)
+                num_nodes += len(records)
+            else:
+                self._add_edges(records)
+                num_edges += len(records)
+        self._flush_time_changes()
+        self._tables = None
+        self._datasets = {}
+        return num_nodes, num_edges
+
+    # Updated graph, built again only when a dataset that is not maintained needs it
+    def tables(self):
+        if self._tables is None:
+            self._tables = self.builder.build()
+        return self._tables
+
+    def __getitem__(self, name):
+        if name not in self._datasets:
+            if name in MAINTAINED_DATASETS:
+                self._datasets[name] = getattr(self, '_' + name)()
+            else:
+                self._datasets[name] = DATASETS[name](self.tables())
+        return self._datasets[name]
+
+    def __iter__(self):
+        return iter(DATASETS)
+
+    def __len__(self):
+        return len(DATASETS)
+
+    def _grow(self):
+        size = len(self.builder.node_keys)
+        if size > len(self.activity):
+            capacity = max(size, 2 * len(self.activity))
+            activity = np.zeros((capacity, len(USER_ACTIVITY)), dtype=np.int64)
+            activity[:len(self.activity)] = self.activity
+            dates = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[ns]')
+            dates[:len(self.dates)] = self.dates
+            self.activity, self.dates = activity, dates
+
+    def _attribute(self, attribute, code):
+        return self.builder.node_columns[attribute][code]
+
+    def _add_nodes(self, records):
+        records = list(records)
+        codes = list(dict.fromkeys(self.builder.node_code(key) for key, _ in records))
+        self._grow()
+
+        # The counts of the updated nodes are taken out with their old attributes, then counted again with the new ones
+        for code in codes:
+            self._count_node(code, -1)
+        for key, values in records:
+            self.builder.add_node(key, values)
+        created_at = self.builder.node_columns['created_at']
+        self.dates[codes] = _parse_dates([created_at[code] for code in codes])
+        for code in codes:
+            self._count_node(code, 1)
+
+    def _count_node(self, code, sign):
+        label = self._attribute('labels', code)
+        if label is not None:
+            self.node_counts[label] += sign
+        if label in self.members:
+            (self.members[label].add if sign > 0 else self.members[label].discard)(code)
+        if label == ':Tweet':
+            self.priority_counts[self._attribute('annotation_postPriority', code) or 'Unknown'] += sign
+        for event in self.events_of.get(code, ()):
+            self._count_time(code, event, sign)
+        for tweet in self.tweets_of.get(code, ()):
+            self._count_time(tweet, code, sign)
+
+    def _add_edges(self, records):
+        node_code = self.builder.node_code
+        for source, target, (label,) in records:
+            self.builder.add_edge(source, target, label)
+            source, target = node_code(source), node_code(target)
+            self._grow()
+            self.edge_counts[label] += 1
+            column = ACTIVITY_COLUMNS.get(label)
+            if column is not None:
+                self.activity[source, column] += 1
+            if label == 'IS_ABOUT':
+                self._add_about(source, target)
+            elif label == 'HAS_CATEGORY' and (source, target) not in self.categorized:
+                self.categorized.add((source, target))
+                self.category_counts[target] += 1
+            elif label in EVENT_INTERACTIONS:
+                self._add_interaction(source, target, EVENT_INTERACTIONS[label])
+
+    def _add_about(self, tweet, event):
+        events = self.events_of[tweet]
+        if event in events:
+            return
+        events.append(event)
+        self.tweets_of[event].append(tweet)
+        self.event_counts['Tweets'][event] += 1
+        # The interactions of the tweet with the other tweets about the event now count in its social activity
+        for other, column in self.interactions_of.get(tweet, ()):
+            if event in self.events_of.get(other, ()):
+                self.event_counts[column][event] += 1
+        self._count_time(tweet, event, 1)
+
+    def _add_interaction(self, source, target, column):
+        self.interactions_of[source].append((target, column))
+        if target != source:
+            self.interactions_of[target].append((source, column))
+        target_events = self.events_of.get(target, ())
+        for event in self.events_of.get(source, ()):
+            if event in target_events:
+                self.event_counts[column][event] += 1
+
+    # A (tweet, event) pair counts in the time series once the tweet has a date and the event its attributes
+    def _count_time(self, tweet, event, sign):
+        pair = (tweet, event)
+        if sign > 0:
+            event_id = self._attribute('id', event)
+            if pair in self.timed or np.isnat(self.dates[tweet]) or event_id is None \
+                    or self._attribute('labels', event) != ':Event':
+                return
+            self.timed.add(pair)
+        elif pair in self.timed:
+            self.timed.remove(pair)
+        else:
+            return
+        date = self.dates[tweet]
+        self._time_changes.append(('Event ID', self._attribute('id', event), date, sign))
+        event_type = self._attribute('eventType', event)
+        if event_type is not None:
+            # A tweet counts once for its type of event
+            self.typed[(tweet, event_type)] += sign
+            if self.typed[(tweet, event_type)] == (1 if sign > 0 else 0):
+                self._time_changes.append(('Event Type', event_type, date, sign))
+            if not self.typed[(tweet, event_type)]:
+                del self.typed[(tweet, event_type)]
+
+    def _flush_time_changes(self):
+        if not self._time_changes:
+            return
+        changes = pd.DataFrame(self._time_changes, columns=['Level', 'Key', 'Date', 'Change'])
+        changes['Date'] = pd.to_datetime(changes['Date'])
+        self._time_changes = []
+        for resolution, freq in TIME_RESOLUTIONS.items():
+            sums = changes.groupby(['Level', 'Key', pd.Grouper(key='Date', freq=freq)])['Change'].sum()
+            for (level, key, date), change in sums[sums != 0].items():
+                counts = self.time_counts[resolution][level][key]
+                counts[date] += change
+                if not counts[date]:
+                    del counts[date]
+                self._stale_series.add((resolution, level, key))
+
+    def _key_figures(self):
+        return {
+            'Number of nodes': len(self.builder.node_keys),
+            'Number of edges': len(self.builder.sources),
+            'Number of tweets': self.node_counts[':Tweet'],
+            'Number of users': self.node_counts[':User'],
+            'Number of hashtags': self.node_counts[':Hashtag'],
+        }
+
+    def _interactions(self):
+        return pd.DataFrame({
+            'Type of interaction': list(USER_INTERACTIONS.values()),
+            'Number of interactions': [self.edge_counts[label] for label in USER_INTERACTIONS],
+        })
+
+    def _priority(self):
+        return pd.DataFrame([(priority, count) for priority, count in self.priority_counts.items() if count],
+                            columns=['Priority', 'Count'])
+
+    def _listed(self, label):
+        codes = sorted(self.members[label])
+        return codes, [self._attribute('id', code) for code in codes]
+
+    def _counts_by_id(self, counts, ids):
+        by_id = Counter()
+        for code, count in counts.items():
+            by_id[self._attribute('id', code)] += count
+        return np.array([by_id[node_id] for node_id in ids], dtype=np.int64)
+
+    def _category(self):
+        _, categories = self._listed(':PostCategory')
+        return pd.DataFrame({'Category': categories,
+                             'Number of Tweets': self._counts_by_id(self.category_counts, categories)})
+
+    def _event_metrics(self):
+        events, event_ids = self._listed(':Event')
+        metrics = pd.DataFrame({
+            'Event ID': np.array(event_ids, dtype=object),
+            'Event Type': np.array([self._attribute('eventType', event) for event in events], dtype=object),
+        })
+        for column, counts in self.event_counts.items():
+            metrics[column] = self._counts_by_id(counts, event_ids)
+        return metrics
+
+    def _time_series(self):
+        # Only the series changed by the deltas are built again
+        for resolution, level, key in self._stale_series:
+            counts = self.time_counts[resolution][level][key]
+            if counts:
+                dates = sorted(counts)
+                self._series[resolution][level][key] = pd.Series([counts[date] for date in dates], dtype=np.int64,
+                                                                 index=pd.DatetimeIndex(dates, name='Date'))
+            else:
+                self._series[resolution][level].pop(key, None)
+        self._stale_series = set()
+        return {resolution: {level: dict(series) for level, series in levels.items()}
+                for resolution, levels in self._series.items()}
+
+    def _user_activity(self):
+        users, user_ids = self._listed(':User')
+        counts = self.activity[users]
+        activity_df = pd.DataFrame({
+            'User ID': np.array(user_ids, dtype=object),
+            'User': np.array([self._attribute('name', user) for user in users], dtype=object),
+        })
+        activity_df[list(USER_ACTIVITY.values())] = counts
+        activity_df['Total'] = counts.sum(axis=1)
+        return activity_df
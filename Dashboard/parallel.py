@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from diagnostics import measure
+from graph_tables import GraphTables
+from utils import (as_tables, edge_type_counts, event_metrics, is_computed, node_type_counts, remember,
+                   tweet_time_series, tweets_per_category, tweets_per_priority, user_activity)
+
+'''This file contains the parallel computation of the dashboard aggregates. The columns of the graph tables are
+written once as memory-mapped files, and every worker process maps them instead of receiving a pickled graph.'''
+
+# Independent aggregates computed after loading a graph
+AGGREGATES = {
+    'node_type_counts': node_type_counts,
+    'tweets_per_category': tweets_per_category,
+    'tweets_per_priority': tweets_per_priority,
+    'edge_type_counts': edge_type_counts,
+    'user_activity': user_activity,
+    'event_metrics': event_metrics,
+    'tweet_time_series': tweet_time_series,
+}
+
+# Below this number of edges, starting the worker processes costs more than the aggregates themselves
+PARALLEL_MIN_EDGES = 500_000
+
+# Start method of the worker processes: the dashboard runs in a multi-threaded server, which must not be forked, so the
+# workers are started by a single-threaded fork server (or spawned where there is none)
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Function to create a pool of worker processes started with START_METHOD
+def process_pool(max_workers, **kwargs):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(START_METHOD), **kwargs)
+
+# Folder of the memory-mapped files (in RAM when /dev/shm exists)
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Function to write the columns of the tables in a folder: integer and date arrays as .npy files, dictionaries in one pickle
+def write_shared_tables(tables, directory):
+    dictionaries = {}
+    for table_name, table in (('nodes', tables.nodes), ('edges', tables.edges)):
+        for column in table.columns:
+            values = table[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+            elif values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+                codes, categories = pd.factorize(values)
+            else:
+                codes, categories = values.to_numpy(), None
+            np.save(os.path.join(directory, f'{table_name}.{column}.npy'), codes)
+            dictionaries[table_name, column] = categories
+    with open(os.path.join(directory, 'dictionaries.pickle'), 'wb') as file:
+        pickle.dump(dictionaries, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+# Function to map the tables written by write_shared_tables (the integer columns are not copied)
+def read_shared_tables(directory):
+    with open(os.path.join(directory, 'dictionaries.pickle'), 'rb') as file:
+        dictionaries = pickle.load(file)
+    tables = {'nodes': {}, 'edges': {}}
+    for (table_name, column), categories in dictionaries.items():
+        codes = np.load(os.path.join(directory, f'{table_name}.{column}.npy'), mmap_mode='r')
+        tables[table_name][column] = codes if categories is None else pd.Categorical.from_codes(codes, categories=categories)
+    return GraphTables(pd.DataFrame(tables['nodes']), pd.DataFrame(tables['edges'], copy=False))
+
+
+_worker_tables = None
+
+def _attach(directory):
+    global _worker_tables
+    _worker_tables = read_shared_tables(directory)
+
+def _compute(name):
+    return name, AGGREGATES[name](_worker_tables)
+
+# Function to compute the missing aggregates of a large graph in parallel worker processes, stored with the graph as if
+# they had been computed by the functions of utils.py (small graphs, or a single CPU, are left to these functions)
+def prefetch_aggregates(G, names=tuple(AGGREGATES), max_workers=None):
+    tables = as_tables(G)
+    missing = [name for name in names if not is_computed(AGGREGATES[name], tables)]
+    workers = min(len(missing), max_workers or os.cpu_count() or 1)
+    if workers <= 1 or tables.number_of_edges() < PARALLEL_MIN_EDGES:
+        return
+
+    with measure('parallel aggregates'), tempfile.TemporaryDirectory(prefix='dashboard-', dir=SHARED_DIR) as directory:
+        write_shared_tables(tables, directory)
+        with process_pool(workers, initializer=_attach, initargs=(directory,)) as pool:
+            for name, result in pool.map(_compute, missing):
+                remember(AGGREGATES[name], tables, result)
+
+# Function to compute the aggregates of a graph, in parallel worker processes for large graphs
+def compute_aggregates(G, names=tuple(AGGREGATES), max_workers=None):
+    tables = as_tables(G)
+    prefetch_aggregates(tables, names, max_workers)
+    return {name: AGGREGATES[name](tables) for name in names}
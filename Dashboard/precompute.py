@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+
+from datasets import dashboard_datasets
+from diagnostics import Diagnostics, activate, measure
+from graph_tables import read_graph_tables
+from incremental import IncrementalDatasets
+from snapshot import SNAPSHOT_EXTENSION, write_snapshot
+
+'''This file is the command line tool to precompute the datasets of the dashboard from a GraphML file.
+
+Usage: python precompute.py database_formated_for_NetworkX.graphml [-o database.snapshot] [--delta new_tweets.graphml ...]
+
+The snapshot can then be uploaded in the dashboard instead of the GraphML file: the dashboard only renders it.'''
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the datasets of the dashboard from a GraphML file')
+    parser.add_argument('graphml', help='GraphML file of the crisis events')
+    parser.add_argument('--delta', nargs='+', default=[], help='delta files of new nodes and edges, applied in order')
+    parser.add_argument('--diagnostics', help='write the time and memory of the stages to this JSON file')
+    parser.add_argument('--profile', help='write a cProfile dump of the run to this file (read it with pstats or snakeviz)')
+    parser.add_argument('-o', '--output', help=f'snapshot file (default: the GraphML file with the .{SNAPSHOT_EXTENSION} extension)')
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.graphml)[0] + '.' + SNAPSHOT_EXTENSION
+
+    diagnostics = Diagnostics(track_allocations=True) if args.diagnostics else None
+    activate(diagnostics)
+    if args.profile:
+        profiler = Diagnostics()
+        profiler.start_profile()
+
+    start = time.perf_counter()
+    with measure('read_graph_tables'):
+        G = read_graph_tables(args.graphml)
+    print(f'Loaded {G.number_of_nodes()} nodes and {G.number_of_edges()} edges in {time.perf_counter() - start:.1f} s')
+
+    start = time.perf_counter()
+    if args.delta:
+        incremental = IncrementalDatasets(G)
+        for path in args.delta:
+            with measure('apply delta'):
+                num_nodes, num_edges = incremental.apply(path)
+            print(f'Applied {path}: {num_nodes} nodes and {num_edges} edges')
+        datasets = dict(incremental)
+    else:
+        datasets = dashboard_datasets(G)
+    print(f'Computed {len(datasets)} datasets in {time.perf_counter() - start:.1f} s')
+
+    write_snapshot(datasets, output, source=os.path.basename(args.graphml))
+    print(f'Snapshot written to {output} ({os.path.getsize(output) / 1024:.0f} KB)')
+
+    if diagnostics is not None:
+        with open(args.diagnostics, 'w') as file:
+            file.write(diagnostics.to_json())
+        print(diagnostics.summary().to_string(index=False))
+    if args.profile:
+        profiler.stop_profile()
+        with open(args.profile, 'wb') as file:
+            file.write(profiler.profile_dump()[1])
+
+
+if __name__ == '__main__':
+    main()
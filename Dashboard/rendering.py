@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+'''This file contains the reduction of the data sent to the browser: tables are sorted and sliced in pages on the
+server, bar charts keep their largest bars and sum the others in one "Other" bar, and time series are downsampled
+with LTTB (Largest-Triangle-Three-Buckets). The size of what is rendered does not depend on the size of the graph.'''
+
+# Largest number of bars of a bar chart (the last one being the "Other" bar)
+MAX_BARS = 20
+
+# Largest number of points of a line chart
+MAX_POINTS = 1000
+
+# Number of rows of a page of a table
+PAGE_SIZE = 100
+
+def num_pages(df, page_size=PAGE_SIZE):
+    return max(1, math.ceil(len(df) / page_size))
+
+# Function to get a page of a table sorted on a column (pages start at 1)
+def sort_page(df, sort_by, ascending=False, page=1, page_size=PAGE_SIZE):
+    end = page * page_size
+    if pd.api.types.is_numeric_dtype(df[sort_by]):
+        # Partial sort: only the rows up to the end of the page are ordered
+        rows = df.nsmallest(end, sort_by) if ascending else df.nlargest(end, sort_by)
+    else:
+        rows = df.sort_values(sort_by, ascending=ascending, kind='stable')
+    return rows.iloc[end - page_size:end]
+
+# Function to keep the n - 1 rows of a table with the largest values (in their order), the other rows are summed
+# in a last "Other" row
+def top_n(df, label, values, n=MAX_BARS, other='Other'):
+    if len(df) <= n:
+        return df
+    keep = np.sort(np.argsort(-df[values].sum(axis=1).to_numpy(), kind='stable')[:n - 1])
+    rest = np.setdiff1d(np.arange(len(df)), keep)
+    other_row = pd.DataFrame([{label: f'{other} ({len(rest)})', **df.iloc[rest][values].sum().to_dict()}])
+    return pd.concat([df.iloc[keep][[label] + values], other_row], ignore_index=True)
+
+# Function to select the positions of the points of a line kept by LTTB: the first and last points, and in each of
+# the threshold - 2 buckets in between, the point making the largest triangle with the previous kept point and the
+# mean of the next bucket
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = (edges[bucket + 1], edges[bucket + 2]) if bucket + 2 < len(edges) else (n - 1, n)
+        mean_x, mean_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - mean_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (mean_y - y[previous]))
+        previous = selected[bucket + 1] = start + int(np.argmax(areas))
+    return selected
+
+# Function to downsample a line chart table to at most max_points rows
+def downsample(df, x, y, max_points=MAX_POINTS):
+    if len(df) <= max_points:
+        return df
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype('datetime64[ns]').astype(np.int64)
+    return df.iloc[lttb(xs, df[y].to_numpy(), max_points)].reset_index(drop=True)
@@ -0,0 +1,81 @@
+import functools
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+'''This file contains the snapshot format: the datasets of the panels, precomputed from a graph, in one small file.
+
+A snapshot is gzipped JSON (and not a pickle, so that opening an uploaded snapshot cannot run code):
+    {"format": "crisis-dashboard-snapshot", "version": 2, "source": ..., "datasets": {name: value}}
+DataFrames, Series and dictionaries with non-string keys are encoded as tagged objects.'''
+
+SNAPSHOT_FORMAT = 'crisis-dashboard-snapshot'
+# Version of the snapshots, changed when the datasets of the panels change (older snapshots miss some of them)
+SNAPSHOT_VERSION = 2
+SNAPSHOT_EXTENSION = 'snapshot'
+
+def _encode_array(values):
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return {'dtype': 'datetime64[ns]', 'values': values.astype('datetime64[ns]').astype('int64').tolist()}
+    return {'dtype': str(values.dtype), 'values': values.tolist()}
+
+def _decode_array(array):
+    if array['dtype'].startswith('datetime64'):
+        return pd.to_datetime(np.asarray(array['values'], dtype=np.int64), unit='ns')
+    return np.asarray(array['values'], dtype=object if array['dtype'] in ('object', 'str', 'string') else array['dtype'])
+
+def _encode(value):
+    if isinstance(value, pd.DataFrame):
+        return {'__frame__': [[column, _encode_array(value[column])] for column in value.columns]}
+    if isinstance(value, pd.Series):
+        return {'__series__': {'name': value.name, 'index_name': value.index.name,
+                               'index': _encode_array(value.index), 'values': _encode_array(value)}}
+    if isinstance(value, dict):
+        return {'__dict__': [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _decode(value):
+    if isinstance(value, dict) and '__frame__' in value:
+        return pd.DataFrame({column: _decode_array(array) for column, array in value['__frame__']})
+    if isinstance(value, dict) and '__series__' in value:
+        series = value['__series__']
+        index = pd.Index(_decode_array(series['index']), name=series['index_name'])
+        return pd.Series(_decode_array(series['values']), index=index, name=series['name'])
+    if isinstance(value, dict) and '__dict__' in value:
+        return {_decode(key): _decode(item) for key, item in value['__dict__']}
+    return value
+
+# Function to write the datasets of the panels in a snapshot file
+def write_snapshot(datasets, path, source=None):
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'source': source,
+        'datasets': {name: _encode(value) for name, value in datasets.items()},
+    }
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        json.dump(snapshot, file)
+
+# Function to read the datasets of a snapshot (content of the file as bytes)
+def read_snapshot(data):
+    try:
+        snapshot = json.loads(gzip.decompress(data).decode('utf-8'))
+    except (OSError, ValueError) as error:
+        raise ValueError('This file is not a dashboard snapshot') from error
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError('This file is not a dashboard snapshot')
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {snapshot.get('version')} is not supported (expected {SNAPSHOT_VERSION})")
+    return {name: _decode(value) for name, value in snapshot['datasets'].items()}
+
+# Function to read an uploaded snapshot (kept in memory, so that the reruns of the dashboard do not decode it again)
+@functools.lru_cache(maxsize=4)
+def load_snapshot(data):
+    return read_snapshot(data)
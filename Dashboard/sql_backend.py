@@ -0,0 +1,418 @@
+import importlib.util
+import io
+import os
+import sqlite3
+import threading
+import urllib.request
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from centrality import GATHER_INFORMATION, rank_central_users
+from datasets import DATASETS
+from diagnostics import measure
+from graph_cache import CACHE_DIR, content_hash, evict_disk
+from graph_tables import EDGE_ATTRIBUTES, NODE_ATTRIBUTES
+from graphml_stream import iter_graphml
+from utils import (TIME_RESOLUTIONS, USER_ACTIVITY, USER_INTERACTIONS, build_interaction_graph, counts_over_time,
+                   event_type_metrics, interaction_metrics)
+
+'''This file contains the SQL backend of the dashboard: the uploaded GraphML is bulk-loaded once into a node table and
+an edge table of an embedded database (DuckDB if it is installed, SQLite otherwise), indexed on the node labels, the
+event types and the edge labels, and the aggregates of the panels are SQL queries with the same outputs as utils.py.
+
+The database is a file next to the cached graphs, so the queries are not bound by the memory. The central users and
+the interactions between users are graph algorithms: they run in memory on the edges between two users, read from the
+edge table.'''
+
+ENGINES = ('duckdb', 'sqlite') if importlib.util.find_spec('duckdb') is not None else ('sqlite',)
+
+# Version of the layout and parsing of the database (part of the name of the database files)
+SQL_VERSION = 2
+
+# Number of databases kept open
+MAX_OPEN_DATABASES = 4
+
+# Columns of the node table, in the order of NODE_ATTRIBUTES
+NODE_COLUMNS = ('labels', 'id', 'name', 'event_type', 'created_at', 'priority')
+
+SCHEMA = (
+    'CREATE TABLE nodes (code INTEGER PRIMARY KEY, node VARCHAR, labels VARCHAR, id VARCHAR, name VARCHAR, '
+    'event_type VARCHAR, created_at TIMESTAMP, priority VARCHAR)',
+    'CREATE TABLE edges (source INTEGER, target INTEGER, label VARCHAR)',
+)
+
+# Indexes created once the tables are loaded (faster than maintaining them during the load)
+INDEXES = (
+    'CREATE INDEX nodes_labels ON nodes (labels)',
+    'CREATE INDEX nodes_event_type ON nodes (event_type)',
+    'CREATE INDEX edges_label ON edges (label)',
+)
+
+# Period of a date for each resolution of TIME_RESOLUTIONS (weeks end on Sunday, as the pandas 'W' frequency)
+TIME_BUCKETS = {
+    'duckdb': {
+        'Hour': "date_trunc('hour', {0})",
+        'Day': "date_trunc('day', {0})",
+        'Week': 'CAST({0} AS DATE) + CAST((7 - dayofweek({0})) % 7 AS INTEGER)',
+    },
+    'sqlite': {
+        'Hour': "strftime('%Y-%m-%d %H:00:00', {0})",
+        'Day': 'date({0})',
+        'Week': "date({0}, 'weekday 0')",
+    },
+}
+
+# Function to open a database file (read-only connections fail on a missing file instead of creating an empty one)
+def _connect(path, engine, read_only=False):
+    if engine == 'duckdb':
+        import duckdb  # optional dependency, imported when it is used
+        return duckdb.connect(path, read_only=read_only)
+    if read_only:
+        return sqlite3.connect(f'file:{urllib.request.pathname2url(path)}?mode=ro', uri=True, check_same_thread=False)
+    return sqlite3.connect(path, check_same_thread=False)
+
+def _dates(values, engine):
+    dates = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601').dt.tz_convert(None)
+    if engine == 'duckdb':
+        return dates
+    return dates.dt.strftime('%Y-%m-%d %H:%M:%S').astype(object).where(dates.notna(), None).tolist()
+
+def _placeholders(count):
+    return ', '.join('?' * count)
+
+# Loader of a GraphML file into the node and edge tables, batch by batch. Nodes are numbered in the order they are
+# seen, as in the graph tables; a node seen again gets the attributes it is given (as NetworkX does).
+class _Loader:
+    def __init__(self, connection, engine):
+        self.connection = connection
+        self.engine = engine
+        self.codes = {}
+
+    def _insert(self, table, columns):
+        if not columns[0]:
+            return
+        if self.engine == 'duckdb':
+            self.connection.append(table, pd.DataFrame(dict(enumerate(columns))))
+        else:
+            self.connection.executemany(f'INSERT INTO {table} VALUES ({_placeholders(len(columns))})', zip(*columns))
+
+    def _insert_nodes(self, rows):
+        if rows:
+            columns = [list(column) for column in zip(*rows)]
+            position = 2 + NODE_COLUMNS.index('created_at')  # after the code and the GraphML id
+            columns[position] = _dates(columns[position], self.engine)
+            self._insert('nodes', columns)
+
+    def _node_code(self, key, new_rows):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.codes)
+            new_rows.append((code, key) + (None,) * len(NODE_COLUMNS))
+        return code
+
+    def add_nodes(self, records):
+        new_rows, updates = [], {}
+        for key, values in records:
+            code = self.codes.get(key)
+            if code is None:
+                self.codes[key] = len(self.codes)
+                new_rows.append((self.codes[key], key) + tuple(values))
+            else:
+                previous = updates.get(code, (None,) * len(NODE_COLUMNS))
+                updates[code] = tuple(previous if value is None else value for value, previous in zip(values, previous))
+        self._insert_nodes(new_rows)
+        if updates:
+            assignments = ', '.join(f'{column} = COALESCE(?, {column})' for column in NODE_COLUMNS)
+            position = NODE_COLUMNS.index('created_at')
+            dates = _dates([values[position] for values in updates.values()], self.engine)
+            if self.engine == 'duckdb':
+                dates = [None if pd.isna(date) else date.to_pydatetime() for date in dates]
+            rows = [values[:position] + (date,) + values[position + 1:] + (code,)
+                    for (code, values), date in zip(updates.items(), dates)]
+            self.connection.executemany(f'UPDATE nodes SET {assignments} WHERE code = ?', rows)
+
+    def add_edges(self, records):
+        new_rows, sources, targets, labels = [], [], [], []
+        for source, target, (label,) in records:
+            sources.append(self._node_code(source, new_rows))
+            targets.append(self._node_code(target, new_rows))
+            labels.append(label)
+        self._insert_nodes(new_rows)  # nodes only seen in an edge, without attributes
+        self._insert('edges', [sources, targets, labels])
+
+
+# Function to load a GraphML file (path or file object) into a new database file
+def build_sql_graph(source, path, engine=ENGINES[0]):
+    connection = _connect(path, engine)
+    try:
+        connection.execute('BEGIN TRANSACTION')  # one transaction for the whole load
+        for statement in SCHEMA:
+            connection.execute(statement)
+        loader = _Loader(connection, engine)
+        for kind, records in iter_graphml(source, NODE_ATTRIBUTES, EDGE_ATTRIBUTES):
+            if kind == 'nodes':
+                loader.add_nodes(records)
+            else:
+                loader.add_edges(records)
+        for statement in INDEXES:
+            connection.execute(statement)
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+
+# Graph stored in a database file, with the aggregates of the panels as SQL queries (results are kept once computed).
+# The connection is closed when the graph leaves the open databases, and opened again if a query still comes.
+class SqlGraph:
+    def __init__(self, path, engine=ENGINES[0]):
+        self.path = path
+        self.engine = engine
+        self.connection = _connect(path, engine, read_only=True)
+        self._lock = threading.Lock()  # the panels run in several threads, the connection is used by one at a time
+        self._results = {}
+
+    def query(self, sql, params=()):
+        with self._lock:
+            if self.connection is None:
+                self.connection = _connect(self.path, self.engine, read_only=True)
+            if self.engine == 'duckdb':
+                return self.connection.execute(sql, list(params)).df()
+            return pd.read_sql_query(sql, self.connection, params=list(params))
+
+    def _result(self, name, compute):
+        if name not in self._results:
+            with measure('sql ' + name):
+                self._results[name] = compute()
+        return self._results[name]
+
+    def dataset(self, name):
+        return self._result(name, lambda: SQL_DATASETS[name](self))
+
+    def key_figures(self):
+        counts = self.query(
+            'SELECT (SELECT COUNT(*) FROM nodes) AS nodes, (SELECT COUNT(*) FROM edges) AS edges, '
+            "SUM(CASE WHEN labels = ':Tweet' THEN 1 ELSE 0 END) AS tweets, "
+            "SUM(CASE WHEN labels = ':User' THEN 1 ELSE 0 END) AS users, "
+            "SUM(CASE WHEN labels = ':Hashtag' THEN 1 ELSE 0 END) AS hashtags FROM nodes"
+        ).fillna(0).iloc[0]
+        return {
+            'Number of nodes': int(counts['nodes']),
+            'Number of edges': int(counts['edges']),
+            'Number of tweets': int(counts['tweets']),
+            'Number of users': int(counts['users']),
+            'Number of hashtags': int(counts['hashtags']),
+        }
+
+    # Number of edges of each type of interaction
+    def edge_type_counts(self, interactions=USER_INTERACTIONS):
+        counts = self.query(
+            f'SELECT label, COUNT(*) AS count FROM edges WHERE label IN ({_placeholders(len(interactions))}) '
+            'GROUP BY label', list(interactions))
+        counts = dict(zip(counts['label'], counts['count']))
+        return pd.DataFrame({
+            'Type of interaction': list(interactions.values()),
+            'Number of interactions': np.array([counts.get(label, 0) for label in interactions], dtype=np.int64)
+        })
+
+    # Number of tweets per priority (in the order the priorities first appear in the graph)
+    def tweets_per_priority(self):
+        counts = self.query(
+            "SELECT COALESCE(priority, 'Unknown') AS priority, COUNT(*) AS count FROM nodes WHERE labels = ':Tweet' "
+            'GROUP BY 1 ORDER BY MIN(code)')
+        return dict(zip(counts['priority'], counts['count'].astype(int).tolist()))
+
+    def tweets_per_category(self):
+        counts = self.query(
+            'SELECT c.id AS category, COALESCE(h.count, 0) AS count FROM nodes c LEFT JOIN ('
+            '  SELECT category, COUNT(*) AS count FROM ('
+            '    SELECT DISTINCT e.source AS tweet, t.id AS category FROM edges e JOIN nodes t ON t.code = e.target'
+            "    WHERE e.label = 'HAS_CATEGORY') pairs GROUP BY category"
+            ") h ON h.category = c.id WHERE c.labels = ':PostCategory' ORDER BY c.code")
+        return pd.DataFrame({'Category': counts['category'].to_numpy(dtype=object),
+                             'Number of Tweets': counts['count'].to_numpy(dtype=np.int64)})
+
+    # Tweets, retweets and replies of every event: retweets and replies are the edges between two tweets of the event
+    def event_metrics(self):
+        metrics = self.query(
+            'WITH about AS ('
+            '  SELECT DISTINCT e.source AS tweet, t.id AS event FROM edges e JOIN nodes t ON t.code = e.target'
+            "  WHERE e.label = 'IS_ABOUT'"
+            '), tweets AS (SELECT event, COUNT(*) AS count FROM about GROUP BY event'
+            '), interactions AS ('
+            "  SELECT a.event, SUM(CASE WHEN e.label = 'RETWEETED' THEN 1 ELSE 0 END) AS retweets,"
+            "         SUM(CASE WHEN e.label = 'REPLY_TO' THEN 1 ELSE 0 END) AS replies"
+            '  FROM edges e JOIN about a ON a.tweet = e.source JOIN about b ON b.tweet = e.target AND b.event = a.event'
+            "  WHERE e.label IN ('RETWEETED', 'REPLY_TO') GROUP BY a.event"
+            ') SELECT n.id, n.event_type, COALESCE(t.count, 0) AS tweets, COALESCE(i.retweets, 0) AS retweets, '
+            'COALESCE(i.replies, 0) AS replies FROM nodes n LEFT JOIN tweets t ON t.event = n.id '
+            "LEFT JOIN interactions i ON i.event = n.id WHERE n.labels = ':Event' ORDER BY n.code")
+        return pd.DataFrame({
+            'Event ID': metrics['id'].to_numpy(dtype=object),
+            'Event Type': metrics['event_type'].to_numpy(dtype=object),
+            'Tweets': metrics['tweets'].to_numpy(dtype=np.int64),
+            'Retweets': metrics['retweets'].to_numpy(dtype=np.int64),
+            'Replies': metrics['replies'].to_numpy(dtype=np.int64),
+        })
+
+    def mesure_activity_intensity(self, event_type):
+        return event_type_metrics(self.dataset('event_metrics'), event_type)
+
+    # Number of tweets per period of every type of event and every event, in the layout of utils.tweet_time_series
+    def tweet_time_series(self):
+        rollups = {}
+        for resolution in TIME_RESOLUTIONS:
+            bucket = TIME_BUCKETS[self.engine][resolution].format('tw.created_at')
+            rollups[resolution] = {}
+            for level, column in (('Event Type', 'event_type'), ('Event ID', 'id')):
+                counts = self.query(
+                    f'SELECT ev.{column} AS key, {bucket} AS date, COUNT(DISTINCT a.source) AS count FROM edges a '
+                    'JOIN nodes ev ON ev.code = a.target JOIN nodes tw ON tw.code = a.source '
+                    f"WHERE a.label = 'IS_ABOUT' AND ev.labels = ':Event' AND ev.{column} IS NOT NULL "
+                    'AND tw.created_at IS NOT NULL GROUP BY 1, 2 ORDER BY 1, 2')
+                dates = pd.DatetimeIndex(pd.to_datetime(counts['date'], format='ISO8601').astype('datetime64[ns]'), name='Date')
+                series = pd.Series(counts['count'].to_numpy(dtype=np.int64), index=dates)
+                rollups[resolution][level] = {key: series.iloc[positions] for key, positions
+                                              in counts.groupby('key', sort=False).indices.items()}
+        return rollups
+
+    def tweets_over_time(self, event_type, resolution='Day', event_id=None):
+        rollups = self.dataset('time_series')[resolution]
+        counts = rollups['Event ID'].get(event_id) if event_id is not None else rollups['Event Type'].get(event_type)
+        return counts_over_time(counts, resolution)
+
+    # Activity of each user: one column per type of edge in `activity` the user is the source of, and the total
+    def user_activity(self, activity=USER_ACTIVITY):
+        labels, columns = list(activity), list(activity.values())
+        sums = ', '.join(f'SUM(CASE WHEN label = ? THEN 1 ELSE 0 END) AS c{position}' for position in range(len(labels)))
+        counts = ', '.join(f'COALESCE(a.c{position}, 0) AS c{position}' for position in range(len(labels)))
+        rows = self.query(
+            f'SELECT n.id, n.name, {counts} FROM nodes n LEFT JOIN ('
+            f'  SELECT source, {sums} FROM edges WHERE label IN ({_placeholders(len(labels))}) GROUP BY source'
+            ") a ON a.source = n.code WHERE n.labels = ':User' ORDER BY n.code", labels + labels)
+        activity_df = pd.DataFrame({'User ID': rows['id'].to_numpy(dtype=object), 'User': rows['name'].to_numpy(dtype=object)})
+        counts = rows[[f'c{position}' for position in range(len(labels))]].to_numpy(dtype=np.int64)
+        activity_df[columns] = counts
+        activity_df['Total'] = counts.sum(axis=1)
+        return activity_df
+
+    # Node code, id and name of the users, in the order of their codes (the order of the users in the graph tables)
+    def users(self):
+        return self._result('users', lambda: self.query(
+            "SELECT code, id, name FROM nodes WHERE labels = ':User' ORDER BY code"))
+
+    # Graph of the interactions between users, built from the edges between two users
+    def interaction_graph(self):
+        return self._result('interaction_graph', self._interaction_graph)
+
+    def _interaction_graph(self):
+        users = self.users()['code'].to_numpy(dtype=np.int64)
+        edges = self.query(
+            'SELECT e.label, e.source, e.target FROM edges e '
+            'JOIN nodes s ON s.code = e.source JOIN nodes t ON t.code = e.target '
+            f"WHERE e.label IN ({_placeholders(len(USER_INTERACTIONS))}) AND s.labels = ':User' AND t.labels = ':User'",
+            list(USER_INTERACTIONS))
+        sources = np.searchsorted(users, edges['source'].to_numpy(dtype=np.int64))
+        targets = np.searchsorted(users, edges['target'].to_numpy(dtype=np.int64))
+        return build_interaction_graph(users, {label: (sources[positions], targets[positions]) for label, positions
+                                               in edges.groupby('label').indices.items()})
+
+    def user_interactions(self):
+        users = self.users()
+        return interaction_metrics(self.interaction_graph(), users['id'].to_numpy(dtype=object),
+                                   users['name'].to_numpy(dtype=object))
+
+    # Top users on the three criteria of centrality.central_users: the degrees and the retweets are counted in SQL
+    def central_users(self):
+        labels = list(GATHER_INFORMATION)
+        rows = self.query(
+            'WITH ends AS ('
+            f'  SELECT source AS node FROM edges WHERE label IN ({_placeholders(len(labels))})'
+            f'  UNION ALL SELECT target AS node FROM edges WHERE label IN ({_placeholders(len(labels))})'
+            '), degrees AS (SELECT node, COUNT(*) AS degree FROM ends GROUP BY node'
+            "), retweets AS (SELECT target, COUNT(*) AS count FROM edges WHERE label = 'RETWEETS' GROUP BY target"
+            ') SELECT n.name, COALESCE(d.degree, 0) AS degree, COALESCE(r.count, 0) AS retweeted, '
+            '(SELECT COUNT(*) FROM degrees) AS touched FROM nodes n LEFT JOIN degrees d ON d.node = n.code '
+            "LEFT JOIN retweets r ON r.target = n.code WHERE n.labels = ':User' ORDER BY n.code", labels + labels)
+        touched = int(rows['touched'].iloc[0]) if len(rows) else 0
+        degree_centrality = rows['degree'].to_numpy(dtype=np.int64) / max(touched - 1, 1)
+        return rank_central_users(rows['name'].to_numpy(dtype=object), degree_centrality,
+                                  rows['retweeted'].to_numpy(dtype=np.int64), self.interaction_graph())
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+# Datasets of the panels computed with SQL queries
+SQL_DATASETS = {
+    'key_figures': SqlGraph.key_figures,
+    'interactions': SqlGraph.edge_type_counts,
+    'priority': lambda graph: pd.DataFrame(graph.tweets_per_priority().items(), columns=['Priority', 'Count']),
+    'category': SqlGraph.tweets_per_category,
+    'event_metrics': SqlGraph.event_metrics,
+    'time_series': SqlGraph.tweet_time_series,
+    'user_activity': SqlGraph.user_activity,
+    'user_interactions': SqlGraph.user_interactions,
+    'central_users': SqlGraph.central_users,
+}
+
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()  # held only to read or update _graphs and _building_locks
+_building_locks = {}  # lock of each (content key, engine), held while its database is checked and built
+
+# Function to get the database of an uploaded GraphML file (loaded only the first time this content is seen)
+# `content_key` is the content_hash of the data, when the caller already knows it
+# A file is built under its own lock, so the databases of other files can be opened or built meanwhile.
+def load_sql_graph(data, engine=ENGINES[0], directory=CACHE_DIR, content_key=None):
+    key = (content_key or content_hash(data), engine)
+    path = os.path.join(directory, f'{key[0]}.v{SQL_VERSION}.{engine}')
+    with _graphs_lock:
+        building_lock = _building_locks.setdefault(key, threading.Lock())
+    with building_lock:
+        with _graphs_lock:
+            graph = _graphs.get(key)
+        if os.path.exists(path):
+            os.utime(path)  # the modification time is used as the last access time on disk
+        else:
+            if graph is not None:
+                with _graphs_lock:
+                    _graphs.pop(key, None)
+                graph.close()  # its file was evicted from the disk
+                graph = None
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')  # left by an interrupted load
+            with measure('build_sql_graph'):
+                build_sql_graph(io.BytesIO(data), path + '.tmp', engine)
+            os.replace(path + '.tmp', path)
+            evict_disk(directory)
+        if graph is None:
+            graph = SqlGraph(path, engine)
+        evicted = []
+        with _graphs_lock:
+            _graphs[key] = graph
+            _graphs.move_to_end(key)
+            while len(_graphs) > MAX_OPEN_DATABASES:
+                evicted.append(_graphs.popitem(last=False)[1])
+    for old in evicted:
+        old.close()  # a DuckDB connection holds a lock on its file (closed lazily: it reconnects if used again)
+    return graph
+
+# Datasets of a graph stored in a database, all computed from SQL queries
+class SqlDatasets(Mapping):
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, name):
+        return self.graph.dataset(name)
+
+    def __iter__(self):
+        return iter(DATASETS)
+
+    def __len__(self):
+        return len(DATASETS)
@@ -1,62 +1,370 @@
 import pandas as pd
-import networkx as nx
-import matplotlib.pyplot as plt
 import numpy as np
+import functools
+import weakref
+from diagnostics import measure
+from graph_tables import GraphTables, graph_to_tables
 
 '''This file contains the functions used to extract the data from the graph (and dataframes) and to prepare it for the dashboard'''
 
 # Load the graph
 # G = nx.read_graphml('database_formated_for_NetworkX.graphml')
 
+# Types of interactions between users, with the name displayed in the dashboard
+USER_INTERACTIONS = {'RETWEETS': 'Retweets', 'REPLIED_TO': 'Replies', 'MENTIONS': 'Mentions'}
+
+# Edges counted in the activity of a user
+USER_ACTIVITY = {'POSTED': 'Tweets', 'RETWEETS': 'Retweets', 'REPLIED_TO': 'Replies'}
+
+# Edges between tweets counted in the social activity of an event, with their column in the event metrics
+EVENT_INTERACTIONS = {'RETWEETED': 'Retweets', 'REPLY_TO': 'Replies'}
+
+_graph_tables = weakref.WeakKeyDictionary()
+
+# Function to get the node and edge tables of a graph (a NetworkX graph is converted once, then reused)
+def as_tables(G):
+    if isinstance(G, GraphTables):
+        return G
+    tables = _graph_tables.get(G)
+    if tables is None:
+        tables = _graph_tables[G] = graph_to_tables(G)
+    return tables
+
+# Index of the graph, built with grouped operations on the node and edge tables
+class GraphIndex:
+    def __init__(self, tables):
+        nodes, edges = tables.nodes, tables.edges
+
+        # node label -> node codes, edge label -> (source codes, target codes)
+        self.nodes_by_label = {label: codes for label, codes
+                               in nodes.groupby('labels', observed=True).indices.items()}
+        self.edge_positions_by_label = edges.groupby('label', observed=True).indices
+        sources, targets = edges['source'].to_numpy(), edges['target'].to_numpy()
+        self.edges_by_label = {label: (sources[positions], targets[positions]) for label, positions
+                               in self.edge_positions_by_label.items()}
+
+        # Distinct (tweet, event id) / (tweet, category id) pairs of the IS_ABOUT / HAS_CATEGORY edges
+        self.is_about = self._tweet_pairs(tables, 'IS_ABOUT', 'Event ID')
+        self.has_category = self._tweet_pairs(tables, 'HAS_CATEGORY', 'Category')
+
+    def _tweet_pairs(self, tables, label, column):
+        sources, targets = self.edges(label)
+        # The ids are read once per distinct target (a few events and categories)
+        distinct, positions = np.unique(targets, return_inverse=True)
+        target_ids = tables.node_values('id', distinct)[positions]
+        return pd.DataFrame({'tweet': sources, column: target_ids}).drop_duplicates()
+
+    def node_codes(self, label):
+        return self.nodes_by_label.get(label, np.empty(0, dtype=np.intp))
+
+    def edges(self, label):
+        empty = np.empty(0, dtype=np.int32)
+        return self.edges_by_label.get(label, (empty, empty))
+
+    # Positions in the edge table of the edges of a label
+    def edge_positions(self, label):
+        return self.edge_positions_by_label.get(label, np.empty(0, dtype=np.intp))
+
+    def count_edges(self, label):
+        return len(self.edges(label)[0])
+
+
+_derived = weakref.WeakKeyDictionary()
+
+def _hashable(value):
+    return tuple(value.items()) if isinstance(value, dict) else value
+
+def _key(function, args, kwargs):
+    return (function.__name__, tuple(_hashable(arg) for arg in args),
+            tuple((name, _hashable(value)) for name, value in sorted(kwargs.items())))
+
+# Decorator to compute a function of the graph once per graph (results are kept as long as the graph tables)
+def per_graph(function):
+    @functools.wraps(function)
+    def wrapper(G, *args, **kwargs):
+        tables = as_tables(G)
+        results = _derived.setdefault(tables, {})
+        key = _key(function, args, kwargs)
+        if key not in results:
+            with measure(function.__name__):
+                results[key] = function(tables, *args, **kwargs)
+        return results[key]
+    return wrapper
+
+# Function to store the result of a per_graph function computed elsewhere (e.g. in a worker process)
+def remember(function, G, result, *args, **kwargs):
+    _derived.setdefault(as_tables(G), {})[_key(function, args, kwargs)] = result
+
+# Function to check if a per_graph function has already been computed for a graph
+def is_computed(function, G, *args, **kwargs):
+    return _key(function, args, kwargs) in _derived.get(as_tables(G), {})
+
+# Function to get the index of a graph (built once per graph, then reused)
+@per_graph
+def graph_index(G):
+    return GraphIndex(G)
+
+# Function to count the nodes of each label (':Tweet', ':User', ':Hashtag', ...)
+@per_graph
+def node_type_counts(G):
+    return G.nodes['labels'].value_counts(sort=False).to_dict()
+
+# Function to get the key figures shown at the top of the dashboard
+@per_graph
+def key_figures(G):
+    node_counts = node_type_counts(G)
+    return {
+        'Number of nodes': G.number_of_nodes(),
+        'Number of edges': G.number_of_edges(),
+        'Number of tweets': node_counts.get(':Tweet', 0),
+        'Number of users': node_counts.get(':User', 0),
+        'Number of hashtags': node_counts.get(':Hashtag', 0),
+    }
+
+# Tweets of an event (or of a type of event) and the retweets and replies between them, as integer index arrays:
+# node codes of the tweets and positions of the edges in the edge table
+class EventView:
+    __slots__ = ('tweets', 'edges')
+
+    def __init__(self, tweets, edges):
+        self.tweets = tweets  # sorted node codes
+        self.edges = edges  # edge label (EVENT_INTERACTIONS) -> sorted edge positions
+
+    def count_edges(self, label):
+        return len(self.edges.get(label, ()))
+
+EMPTY_EVENT_VIEW = EventView(np.empty(0, dtype=np.int32), {})
+
+# Views of every event id and every type of event, materialized once per graph with grouped operations.
+# A tweet belongs to an event when it IS_ABOUT it, and to a type when it is about one of its events; the edges of a
+# view are the interactions between two of its tweets.
+class EventViews:
+    def __init__(self, tables, index):
+        events = index.node_codes(':Event')
+        event_types = pd.DataFrame({'Event ID': tables.node_values('id', events),
+                                    'Event Type': tables.node_values('eventType', events)}).drop_duplicates()
+        self.pairs = index.is_about.merge(event_types, on='Event ID')  # one row per (tweet, event), with its type
+
+        sources, targets = tables.edges['source'].to_numpy(), tables.edges['target'].to_numpy()
+        self.by_event = self._views(index.is_about, 'Event ID', index, sources, targets)
+        by_type = self.pairs[['tweet', 'Event Type']].drop_duplicates()
+        self.by_type = self._views(by_type, 'Event Type', index, sources, targets)
+
+    @staticmethod
+    def _views(pairs, key, index, sources, targets):
+        tweets = pairs['tweet'].to_numpy()
+        views = {value: EventView(np.sort(tweets[positions]).astype(np.int32), {})
+                 for value, positions in pairs.groupby(key).indices.items()}
+        for label in EVENT_INTERACTIONS:
+            positions = index.edge_positions(label)
+            # (edge, view) pairs where the source and then also the target of the edge are tweets of the view
+            inside = pd.DataFrame({'edge': positions, 'tweet': sources[positions]}).merge(pairs, on='tweet')
+            target_side = pd.DataFrame({'edge': positions, 'tweet': targets[positions]}).merge(pairs, on='tweet')
+            inside = inside[['edge', key]].merge(target_side[['edge', key]], on=['edge', key])
+            edges = inside['edge'].to_numpy()
+            for value, found in inside.groupby(key).indices.items():
+                views[value].edges[label] = np.sort(edges[found]).astype(np.int32)
+        return views
+
+# Function to get the views of the events of a graph (materialized once per graph, then reused)
+@per_graph
+def event_views(G):
+    return EventViews(G, graph_index(G))
+
+# Function to get the view of an event, or of all the events of a type (empty if there is none)
+def event_view(G, event_id=None, event_type=None):
+    views = event_views(G)
+    view = views.by_event.get(event_id) if event_id is not None else views.by_type.get(event_type)
+    return EMPTY_EVENT_VIEW if view is None else view
+
+# Function to measure the tweets, retweets and replies of every event, read from the event views
+# Retweets and replies are the edges between two tweets of the same event
+@per_graph
+def event_metrics(G):
+    views = event_views(G).by_event
+    events = graph_index(G).node_codes(':Event')
+    metrics = pd.DataFrame({'Event ID': G.node_values('id', events), 'Event Type': G.node_values('eventType', events)})
+    event_ids = [views.get(event_id, EMPTY_EVENT_VIEW) for event_id in metrics['Event ID']]
+    metrics['Tweets'] = np.array([len(view.tweets) for view in event_ids], dtype=np.int64)
+    for label, column in EVENT_INTERACTIONS.items():
+        metrics[column] = np.array([view.count_edges(label) for view in event_ids], dtype=np.int64)
+    return metrics
+
+# Function to keep the events of one type in the table of event_metrics
+def event_type_metrics(metrics, event_type):
+    return metrics[metrics['Event Type'] == event_type].drop(columns='Event Type').reset_index(drop=True)
+
 # Function to measure the number of interactions for each type of event
 def mesure_activity_intensity(G, event_type):
-    event_ids = [data.get('id') for node, data in G.nodes(data=True)
-                 if data.get('labels') == ':Event' and data.get('eventType') == event_type]
-    event_metrics = []
-    for event_id in event_ids:
-        tweets = [source for source, target, data in G.edges(data=True)
-                  if data.get('label') == 'IS_ABOUT' and G.nodes[target].get('id') == event_id]
-        event_subgraph = G.subgraph(tweets)
-        num_tweets = event_subgraph.number_of_nodes()
-        num_retweets = sum(1 for _, _, data in event_subgraph.edges(data=True) if data.get('label') == 'RETWEETED')
-        num_replies = sum(1 for _, _, data in event_subgraph.edges(data=True) if data.get('label') == 'REPLY_TO')
-        event_metrics.append({
-            'Event ID': event_id,
-            'Tweets': num_tweets,
-            'Retweets': num_retweets,
-            'Replies': num_replies
-        })
-    return pd.DataFrame(event_metrics)
+    return event_type_metrics(event_metrics(G), event_type)
+
+# Resolutions of the precomputed number of tweets over time
+TIME_RESOLUTIONS = {'Hour': 'h', 'Day': 'D', 'Week': 'W'}
+
+# Function to index the creation date of the tweets of every event: one row per (tweet, event), sorted by date
+@per_graph
+def tweet_time_index(G):
+    time_index = event_views(G).pairs.copy()
+    time_index['Date'] = G.nodes['created_at'].to_numpy()[time_index['tweet'].to_numpy()]
+    return time_index.dropna(subset=['Date']).sort_values('Date', ignore_index=True)
+
+# Function to precompute the number of tweets per hour, day and week for every type of event and every event
+# (returns {resolution: {'Event Type': {type: counts}, 'Event ID': {id: counts}}})
+@per_graph
+def tweet_time_series(G):
+    time_index = tweet_time_index(G)
+    by_type = time_index.drop_duplicates(['tweet', 'Event Type'])  # a tweet counts once for its type of event
+    rollups = {}
+    for resolution, freq in TIME_RESOLUTIONS.items():
+        rollups[resolution] = {}
+        for level, rows in (('Event Type', by_type), ('Event ID', time_index)):
+            counts = rows.groupby([level, pd.Grouper(key='Date', freq=freq)]).size()
+            rollups[resolution][level] = {key: series.droplevel(0) for key, series in counts.groupby(level=0)}
+    return rollups
+
+# Function to read the number of tweets over time of a type of event (or of one of its events) in the precomputed counts
+def select_tweets_over_time(time_series, event_type, resolution='Day', event_id=None):
+    rollups = time_series[resolution]
+    counts = rollups['Event ID'].get(event_id) if event_id is not None else rollups['Event Type'].get(event_type)
+    return counts_over_time(counts, resolution)
+
+# Function to turn the counts of the periods with tweets (a series indexed by date, or None) into a Date / Count table
+def counts_over_time(counts, resolution):
+    if counts is None:
+        return pd.DataFrame({'Date': pd.to_datetime([]), 'Count': np.empty(0, dtype=int)})
+    counts = counts.asfreq(TIME_RESOLUTIONS[resolution], fill_value=0)  # periods without tweets count 0
+    return pd.DataFrame({'Date': counts.index, 'Count': counts.to_numpy()})
+
+# Function to get the number of tweets over time of a type of event (or of one of its events)
+def tweets_over_time(G, event_type, resolution='Day', event_id=None):
+    return select_tweets_over_time(tweet_time_series(G), event_type, resolution, event_id)
 
 # Function to count the number of tweets per category
+@per_graph
 def tweets_per_category(G):
-    categories = [data.get('id') for node, data in G.nodes(data=True)
-                 if data.get('labels') == ':PostCategory']
-    tpc = []
-    for category in categories:
-        tweets = [source for source, target, data in G.edges(data=True)
-                  if data.get('label') == 'HAS_CATEGORY' and G.nodes[target].get('id') == category]
-        category_subgraph = G.subgraph(tweets)
-        num_tweets = category_subgraph.number_of_nodes()
-        tpc.append({
-            'Category': category,
-            'Number of Tweets': num_tweets,
-        })
-    return pd.DataFrame(tpc)
+    index = graph_index(G)
+    categories = G.node_values('id', index.node_codes(':PostCategory'))
+    num_tweets = index.has_category.groupby('Category').size().reindex(categories, fill_value=0)
+    return pd.DataFrame({'Category': categories, 'Number of Tweets': num_tweets.to_numpy()})
 
 # tweets_per_category_df = tweets_per_category(G)
 
-from collections import defaultdict
-
 # Function to count the number of tweets per priority
+@per_graph
 def tweets_per_priority(G):
-    priority_nodes = defaultdict(list)
-    for node, data in G.nodes(data=True):
-        if 'labels' in data and data['labels'] == ':Tweet':
-            priority = data.get('annotation_postPriority', 'Unknown')
-            priority_nodes[priority].append(node)
-    priority_counts = {priority: len(nodes_list) for priority, nodes_list in priority_nodes.items()}
-    return priority_counts
+    index = graph_index(G)
+    priorities = as_tables(G).nodes['annotation_postPriority'].iloc[index.node_codes(':Tweet')]
+    priority_counts = priorities.astype(object).fillna('Unknown').value_counts(sort=False)
+    return priority_counts.to_dict()
+
+# Graph of the interactions between users: one sparse matrix (CSR) per type of interaction, where [i, j] is the number
+# of interactions of user i with user j (row / column i is the user of node code users[i])
+class InteractionGraph:
+    __slots__ = ('users', 'matrices')
+
+    def __init__(self, users, matrices):
+        self.users = users
+        self.matrices = matrices
+
+    # Matrix of all the types of interactions together
+    def combined(self):
+        import scipy.sparse as sp
+        return sum(self.matrices.values(), sp.csr_matrix((len(self.users), len(self.users)), dtype=np.int64))
+
+# Function to build the graph of the interactions between users from the interactions of each type, given as the
+# rows (positions in `users`) of their source and target users
+def build_interaction_graph(users, edges):
+    import scipy.sparse as sp  # imported on first use, the landing page of the dashboard does not need it
+    empty = np.empty(0, dtype=np.int64)
+    matrices = {}
+    for label in USER_INTERACTIONS:
+        sources, targets = edges.get(label, (empty, empty))
+        weights = np.ones(len(sources), dtype=np.int64)
+        # Repeated interactions between two users are summed in one weight
+        matrices[label] = sp.csr_matrix((weights, (sources, targets)), shape=(len(users), len(users)))
+    return InteractionGraph(users, matrices)
+
+# Function to build the graph of the interactions between users (built once per graph)
+@per_graph
+def interaction_graph(G):
+    index = graph_index(G)
+    users = index.node_codes(':User')
+    positions = np.full(G.number_of_nodes(), -1, dtype=np.int64)
+    positions[users] = np.arange(len(users))
+    edges = {}
+    for label in USER_INTERACTIONS:
+        sources, targets = (positions[codes] for codes in index.edges(label))
+        between_users = (sources >= 0) & (targets >= 0)
+        edges[label] = (sources[between_users], targets[between_users])
+    return build_interaction_graph(users, edges)
+
+# Function to count the number of edges of each type of interaction
+@per_graph
+def edge_type_counts(G, interactions=USER_INTERACTIONS):
+    index = graph_index(G)
+    return pd.DataFrame({
+        'Type of interaction': list(interactions.values()),
+        'Number of interactions': np.array([index.count_edges(label) for label in interactions], dtype=np.int64)
+    })
+
+# Function to measure the interactions of every user, with sparse matrix operations on the interaction graph:
+# interactions given and received, distinct partners, reciprocity (share of the partners interacting back) and
+# retweet cascades (retweets received, plus the retweets of the users who retweeted, on two levels).
+# `ids` and `names` are the ids and names of the users of the graph.
+def interaction_metrics(graph, ids, names):
+    interactions = graph.combined()
+    partners = (interactions > 0).astype(np.int64)
+    mutual = partners.multiply(partners.T)
+    num_partners = np.asarray(partners.sum(axis=1)).ravel()
+    num_mutual = np.asarray(mutual.sum(axis=1)).ravel()
+
+    retweets = graph.matrices['RETWEETS'].T.tocsr()  # [j, i] = retweets of user j by user i
+    retweeted = np.asarray(retweets.sum(axis=1)).ravel()
+
+    users_df = pd.DataFrame({
+        'User ID': ids,
+        'User': names,
+        'Interactions given': np.asarray(interactions.sum(axis=1)).ravel(),
+        'Interactions received': np.asarray(interactions.sum(axis=0)).ravel(),
+        'Partners': num_partners,
+        'Reciprocity': np.divide(num_mutual, num_partners, out=np.zeros(len(graph.users)), where=num_partners > 0),
+        'Retweeted': retweeted,
+        'Retweet cascade': retweeted + retweets @ retweeted,
+    })
+    return {
+        'reciprocity': mutual.nnz / partners.nnz if partners.nnz else 0.0,
+        'users': users_df,
+    }
+
+@per_graph
+def user_interactions(G):
+    graph = interaction_graph(G)
+    return interaction_metrics(graph, G.node_values('id', graph.users), G.node_values('name', graph.users))
+
+# Function to count the activity of each user (one column per type of edge in `activity`) in one pass over the edges
+# Users are keyed by their id, so two users with the same name are kept apart
+@per_graph
+def user_activity(G, activity=USER_ACTIVITY):
+    n, labels = G.number_of_nodes(), list(activity)
+    edge_labels = G.edges['label'].cat
+
+    # Column of each edge in the result (-1 for the edges that are not counted), then one bincount on (source, column)
+    columns = np.full(len(edge_labels.categories) + 1, -1)
+    positions = edge_labels.categories.get_indexer(labels)
+    columns[positions[positions >= 0]] = np.flatnonzero(positions >= 0)
+    edge_columns = columns[edge_labels.codes.to_numpy()]
+    counted = edge_columns >= 0
+    keys = G.edges['source'].to_numpy()[counted].astype(np.int64) * len(labels) + edge_columns[counted]
+    counts = np.bincount(keys, minlength=n * len(labels)).reshape(n, len(labels))
+
+    users = graph_index(G).node_codes(':User')
+    activity_df = pd.DataFrame({
+        'User ID': G.node_values('id', users),
+        'User': G.node_values('name', users),
+    })
+    activity_df[list(activity.values())] = counts[users]
+    activity_df['Total'] = counts[users].sum(axis=1)
+    return activity_df
 
 # priority_counts = tweets_per_priority(G)
 # priority_counts_df = pd.DataFrame(priority_counts.items(), columns=['Priority', 'Count'])
@@ -85,42 +393,7 @@ def tweets_per_priority(G):
 # num_users = len(user_nodes)
 # num_hashtags = len(hashtag_nodes)
 
-# Get top 10 users for diffferent metrics
-"""We define dataframes based on past calculation as recalculation would be too long"""
-
-top_10_ressemble_info = {
-    'user': ['The Associated Press', 'CNN Breaking News', 'CNN', 'Donald J. Trump',
- 'NBC News', 'ABS-CBN News Channel', 'Reuters Top News', 'Narendra Modi', 'The Denver Post','Fox News'],
-    'degree_centrality': [
-        0.012072, 0.010460, 0.009865, 0.009825, 0.008481,
-        0.007487, 0.007190, 0.006183, 0.005833, 0.005750
-    ]
-}
-
-top_10_ressemble_info_df = pd.DataFrame(top_10_ressemble_info)
-
-top_10_connect_user = {
-    'user': ['Breaking News', 'CNN','NSW RFS','American Red Cross','Global Edmonton',
- 'Impact Your World','USA TODAY','Naheed Nenshi','Harry Styles.','Queensland Police'],
-    'betweenness_centrality': [
-        4.666220e-06, 3.459798e-06, 1.040019e-06, 9.637512e-07,
-        9.429508e-07, 8.805497e-07, 8.181485e-07, 5.962777e-07,
-        5.754774e-07, 5.408100e-07
-    ]
-}
-
-top_10_connect_user_df = pd.DataFrame(top_10_connect_user)
-
-
-top_10_diffuse_info = {
-    'user': ['Scooterissima??','l e x ?','Betty','Bee','gail simmons','Warren Kinsella',
- 'idalis','Able Archer','Nine News Gold Coast','???championsdumonde???'],
-    'nombre_de_fois_retweete': [
-        12, 6, 4, 4, 4, 3, 3, 3, 3, 3
-    ]
-}
-
-top_10_diffuse_info_df = pd.DataFrame(top_10_diffuse_info)
+# Top 10 users for different metrics: see central_users in centrality.py (computed from the uploaded graph)
 
 # # Count the number of interactions between users
 
@@ -0,0 +1,163 @@
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+from xml.sax.saxutils import escape, quoteattr
+
+import pandas as pd
+
+'''This file checks that the backends of the dashboard compute the same datasets. A synthetic crisis graph is
+generated, and the datasets of the in-memory tables (DATASETS) are compared with:
+    - the SQL datasets (SQL_DATASETS) of a database built from the graph, with each available engine;
+    - the datasets of IncrementalDatasets, seeded with a part of the graph and updated with the rest split in deltas.
+
+The "connect" ranking of the central users is an approximate betweenness when the graph has more users than
+BETWEENNESS_PIVOTS: its pivots depend on the order of the users, which differs in a graph built from deltas. For the
+incremental backend it is then compared with the ranking computed from the tables of the updated graph.
+
+Usage:
+    python benchmarks/check_backends.py                  # graph of 20 000 edges, 3 deltas
+    python benchmarks/check_backends.py --edges 100000 --deltas 5 --seed 1
+
+The script exits with an error when a dataset differs, and prints where.
+'''
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'Dashboard')
+
+DEFAULT_EDGES = 20_000
+DEFAULT_DELTAS = 3
+
+MAX_REPORTED = 5  # differences printed per dataset
+
+# Function to list the differences between two values of a dataset (nested dicts of tables, series and numbers)
+# The rows of the tables are compared in any order: the backends do not sort the tied rows the same way.
+def differences(expected, actual, where):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        found = [f'{where}: keys {sorted(map(str, expected.keys() - actual.keys()))} missing, '
+                 f'{sorted(map(str, actual.keys() - expected.keys()))} unexpected'] if expected.keys() != actual.keys() else []
+        for key in expected.keys() & actual.keys():
+            found.extend(differences(expected[key], actual[key], f'{where}[{key!r}]'))
+        return found
+    if isinstance(expected, pd.Series) and isinstance(actual, pd.Series):
+        expected, actual = expected.reset_index(), actual.reset_index()
+    if isinstance(expected, pd.DataFrame) and isinstance(actual, pd.DataFrame):
+        if list(expected.columns) != list(actual.columns):
+            return [f'{where}: columns {list(actual.columns)} instead of {list(expected.columns)}']
+        expected, actual = (table.astype(object).where(table.notna(), None) for table in (expected, actual))
+        key = lambda table: table.map(repr).apply(tuple, axis=1).argsort(kind='stable')
+        expected, actual = (table.iloc[key(table)].reset_index(drop=True) for table in (expected, actual))
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False)
+        except AssertionError as error:
+            return [f'{where}: {" ".join(str(error).split())}']
+        return []
+    if isinstance(expected, float) or isinstance(actual, float):
+        same = (math.isnan(expected) and math.isnan(actual)) or math.isclose(expected, actual, rel_tol=1e-9)
+    else:
+        same = expected == actual
+    return [] if same else [f'{where}: {actual!r} instead of {expected!r}']
+
+# Function to compare the datasets of a backend with the expected ones, returns the number of differing datasets
+def compare(expected, actual, backend):
+    failures = 0
+    for name in expected:
+        found = differences(expected[name], actual[name], name)
+        print(f'{backend:<24}{name:<20}{"ok" if not found else "DIFFERENT"}')
+        for difference in found[:MAX_REPORTED]:
+            print('    ' + difference[:300])
+        failures += bool(found)
+    return failures
+
+# Function to write nodes and edges (as read by iter_graphml) to a GraphML file
+def write_graphml(path, nodes, edges, node_attributes, edge_attributes):
+    def data(attributes, values):
+        return ''.join(f'<data key="{attribute}">{escape(str(value))}</data>'
+                       for attribute, value in zip(attributes, values) if value is not None)
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for attributes, domain in ((node_attributes, 'node'), (edge_attributes, 'edge')):
+            for attribute in attributes:
+                file.write(f'<key id="{attribute}" for="{domain}" attr.name="{attribute}" attr.type="string"/>\n')
+        file.write('<graph edgedefault="directed">\n')
+        for node, values in nodes:
+            file.write(f'<node id={quoteattr(node)}>{data(node_attributes, values)}</node>\n')
+        for source, target, values in edges:
+            file.write(f'<edge source={quoteattr(source)} target={quoteattr(target)}>{data(edge_attributes, values)}</edge>\n')
+        file.write('</graph>\n</graphml>\n')
+
+# Function to split a GraphML file in a base file and deltas, each with a random share of the nodes and edges
+# (an edge may come before its nodes, and the last delta sets again the attributes of some nodes of the base)
+def split_graph(path, directory, num_deltas, seed=0):
+    from graph_tables import EDGE_ATTRIBUTES, NODE_ATTRIBUTES
+    from graphml_stream import iter_graphml
+
+    nodes, edges = [], []
+    for kind, records in iter_graphml(path, NODE_ATTRIBUTES, EDGE_ATTRIBUTES):
+        (nodes if kind == 'nodes' else edges).extend(records)
+    rng = random.Random(seed)
+    rng.shuffle(nodes)
+    rng.shuffle(edges)
+
+    parts = num_deltas + 1
+    paths = []
+    for part in range(parts):
+        part_nodes = nodes[part * len(nodes) // parts:(part + 1) * len(nodes) // parts]
+        part_edges = edges[part * len(edges) // parts:(part + 1) * len(edges) // parts]
+        if part == num_deltas and part > 0:
+            part_nodes = part_nodes + nodes[:min(100, len(nodes) // parts)]
+        paths.append(os.path.join(directory, f'part{part}.graphml'))
+        write_graphml(paths[-1], part_nodes, part_edges, NODE_ATTRIBUTES, EDGE_ATTRIBUTES)
+    return paths[0], paths[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the backends of the dashboard compute the same datasets')
+    parser.add_argument('--edges', type=int, default=DEFAULT_EDGES, help='number of edges of the synthetic graph')
+    parser.add_argument('--deltas', type=int, default=DEFAULT_DELTAS, help='number of deltas applied incrementally')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, DASHBOARD_DIR)
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from centrality import BETWEENNESS_PIVOTS
+    from datasets import DATASETS
+    from graph_tables import read_graph_tables
+    from incremental import IncrementalDatasets
+    from run_benchmarks import graph_path
+    from sql_backend import ENGINES, SqlDatasets, SqlGraph, build_sql_graph
+    from utils import interaction_graph
+
+    path = graph_path(args.edges, args.seed)
+    G = read_graph_tables(path)
+    expected = {name: dataset(G) for name, dataset in DATASETS.items()}
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in ENGINES:
+            database = os.path.join(directory, f'graph.{engine}')
+            build_sql_graph(path, database, engine)
+            graph = SqlGraph(database, engine)
+            try:
+                failures += compare(expected, SqlDatasets(graph), 'sql ' + engine)
+            finally:
+                graph.close()
+
+        base, deltas = split_graph(path, directory, args.deltas, args.seed)
+        incremental = IncrementalDatasets(read_graph_tables(base))
+        for delta in deltas:
+            incremental.apply(delta)
+        if len(interaction_graph(G).users) > BETWEENNESS_PIVOTS:
+            expected['central_users'] = {**expected['central_users'],
+                                         'connect': DATASETS['central_users'](incremental.tables())['connect']}
+        failures += compare(expected, incremental, f'incremental ({args.deltas} deltas)')
+
+    print(f'{failures} dataset(s) differ' if failures else 'all the backends compute the same datasets')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
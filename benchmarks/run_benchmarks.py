@@ -0,0 +1,202 @@
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+
+'''This file benchmarks the functions of the dashboard on synthetic crisis graphs of increasing size.
+
+Every (function, size) is run in a fresh process, which reports its wall time and its peak RSS. The results are
+printed with the scaling of each function (time ~ edges^slope), and can be saved as baselines and compared with them.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000
+    python benchmarks/run_benchmarks.py --save-baseline        # store the results in benchmarks/baselines.json
+    python benchmarks/run_benchmarks.py --compare              # exit with an error on a regression
+'''
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'Dashboard')
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+BASELINES = os.path.join(BENCHMARKS_DIR, 'baselines.json')
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# Relative slowdown (time or memory) above which a result is reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Benchmarked functions: name -> function of (graph tables) run after the graph has been loaded
+def _cases():
+    sys.path.insert(0, DASHBOARD_DIR)
+    import utils
+    from centrality import central_users
+    from parallel import compute_aggregates
+
+    return {
+        'node_type_counts': utils.node_type_counts,
+        'mesure_activity_intensity': lambda G: utils.mesure_activity_intensity(G, 'flood'),
+        'event_metrics': utils.event_metrics,
+        'tweets_per_category': utils.tweets_per_category,
+        'tweets_per_priority': utils.tweets_per_priority,
+        'edge_type_counts': utils.edge_type_counts,
+        'user_activity': utils.user_activity,
+        'user_interactions': utils.user_interactions,
+        'tweets_over_time': lambda G: utils.tweets_over_time(G, 'flood'),
+        'central_users': central_users,
+        'compute_aggregates': compute_aggregates,
+    }
+
+CASES = ('read_graph_tables', 'node_type_counts', 'mesure_activity_intensity', 'event_metrics', 'tweets_per_category',
+         'tweets_per_priority', 'edge_type_counts', 'user_activity', 'user_interactions', 'tweets_over_time',
+         'central_users', 'compute_aggregates', 'sql_aggregates')
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+# Function run in the child process for the SQL backend: load the graph into a database, then run its SQL datasets
+def run_sql_case(path):
+    import tempfile
+    from sql_backend import SQL_DATASETS, SqlGraph, build_sql_graph
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'graph.db')
+        build_sql_graph(path, database)
+        load_rss = _peak_rss_mb()
+        graph = SqlGraph(database)
+        start = time.perf_counter()
+        for name in SQL_DATASETS:
+            graph.dataset(name)
+        seconds = time.perf_counter() - start
+        graph.close()
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': _peak_rss_mb(), 'load_rss_mb': load_rss}))
+
+# Function run in the child process: load the graph, run one case, print the measures as JSON
+def run_case(case, path):
+    sys.path.insert(0, DASHBOARD_DIR)
+    if case == 'sql_aggregates':
+        return run_sql_case(path)
+    from graph_tables import read_graph_tables
+
+    start = time.perf_counter()
+    G = read_graph_tables(path)
+    load_seconds = time.perf_counter() - start
+    load_rss = _peak_rss_mb()
+
+    seconds = load_seconds
+    if case != 'read_graph_tables':
+        function = _cases()[case]
+        start = time.perf_counter()
+        function(G)
+        seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': _peak_rss_mb(), 'load_rss_mb': load_rss}))
+
+# Function to get the synthetic graph of a size (generated once, then kept in benchmarks/data)
+def graph_path(size, seed=0):
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from synthetic_graph import write_synthetic_graph
+
+    path = os.path.join(DATA_DIR, f'synthetic_{size}_{seed}.graphml')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        print(f'Generating {path}...', file=sys.stderr)
+        write_synthetic_graph(path + '.tmp', size, seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+def measure(case, path):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', case, path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Function to estimate the scaling of a case: slope of log(time) against log(edges)
+def scaling(results):
+    points = [(math.log(int(size)), math.log(max(result['seconds'], 1e-6))) for size, result in results.items()]
+    if len(points) < 2:
+        return float('nan')
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else float('nan')
+
+# Function to list the regressions against the baselines (same case and size, slower or bigger than the tolerance)
+def regressions(results, baselines, tolerance):
+    found = []
+    for case, sizes in results.items():
+        for size, result in sizes.items():
+            baseline = baselines.get(case, {}).get(size)
+            if baseline is None:
+                continue
+            for measure_name in ('seconds', 'peak_rss_mb'):
+                if result[measure_name] > baseline[measure_name] * (1 + tolerance):
+                    found.append(f'{case} @ {size} edges: {measure_name} {baseline[measure_name]:.3f} -> {result[measure_name]:.3f}')
+    return found
+
+def plot(results, path):
+    import matplotlib.pyplot as plt
+
+    figure, axis = plt.subplots(figsize=(8, 5))
+    for case, sizes in results.items():
+        axis.loglog([int(size) for size in sizes], [result['seconds'] for result in sizes.values()], marker='o', label=case)
+    axis.set_xlabel('Number of edges')
+    axis.set_ylabel('Wall time (s)')
+    axis.legend(fontsize='small')
+    figure.savefig(path, bbox_inches='tight')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard functions on synthetic crisis graphs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of edges of the graphs')
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results in ' + BASELINES)
+    parser.add_argument('--compare', action='store_true', help='compare the results with the stored baselines')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--plot', help='save the scaling curves to this image')
+    parser.add_argument('--worker', nargs=2, metavar=('CASE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_case(*args.worker)
+        return 0
+
+    paths = {str(size): graph_path(size, args.seed) for size in args.sizes}
+    results = {}
+    print(f'{"case":<28}{"edges":>10}{"time (s)":>12}{"peak RSS (MB)":>16}')
+    for case in args.cases:
+        results[case] = {}
+        for size, path in paths.items():
+            result = results[case][size] = measure(case, path)
+            print(f'{case:<28}{size:>10}{result["seconds"]:>12.4f}{result["peak_rss_mb"]:>16.1f}')
+        print(f'{"":<28}{"scaling":>10}{"E^%.2f" % scaling(results[case]):>12}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.plot:
+        plot(results, args.plot)
+
+    status = 0
+    if args.compare:
+        with open(BASELINES) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print('REGRESSION', regression)
+        status = 1 if found else 0
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(BASELINES):
+            with open(BASELINES) as file:
+                baselines = json.load(file)
+        for case, sizes in results.items():
+            baselines.setdefault(case, {}).update(sizes)
+        with open(BASELINES, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import argparse
+import ast
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+'''This file benchmarks the startup of the dashboard: the time to import the modules imported by app.py in a fresh
+process (what a Streamlit worker pays on a cold start), and the heavy libraries already loaded by then.
+
+Usage:
+    python benchmarks/startup.py                   # median of 5 fresh processes, with the slowest imports
+    python benchmarks/startup.py --save-baseline   # store the result in benchmarks/baselines.json
+    python benchmarks/startup.py --compare         # exit with an error on a regression
+'''
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'Dashboard')
+APP = os.path.join(DASHBOARD_DIR, 'app.py')
+BASELINES = os.path.join(BENCHMARKS_DIR, 'baselines.json')
+
+# Libraries that the landing page does not need, imported by the panels when a graph is uploaded (streamlit itself
+# imports the plotly package for its theme, but not plotly.express)
+HEAVY_MODULES = ('networkx', 'plotly.express', 'matplotlib', 'scipy')
+
+DEFAULT_RUNS = 5
+DEFAULT_TOLERANCE = 0.25
+
+# Function to list the modules imported at the top level of app.py
+def app_imports():
+    with open(APP, encoding='utf-8') as file:
+        tree = ast.parse(file.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+# Function run in the child process: import streamlit, then the other modules of app.py, print the measures as JSON
+def run_worker():
+    sys.path.insert(0, DASHBOARD_DIR)
+    start = time.perf_counter()
+    importlib.import_module('streamlit')
+    streamlit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for module in app_imports():
+        importlib.import_module(module)
+    print(json.dumps({
+        'streamlit_seconds': streamlit_seconds,
+        'seconds': time.perf_counter() - start,
+        'heavy_modules': [module for module in HEAVY_MODULES if module in sys.modules],
+    }))
+
+def measure():
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker'],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Function to get the slowest imports of a fresh start, from the report of python -X importtime (cumulative seconds)
+def slowest_imports(limit=10):
+    report = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--worker'],
+                            check=True, capture_output=True, text=True).stderr
+    imports = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:') or '|' not in line or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # top-level imports only (nested imports are indented)
+            imports[name.strip()] = int(cumulative) / 1e6
+    return sorted(imports.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the dashboard')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--save-baseline', action='store_true', help='store the result in ' + BASELINES)
+    parser.add_argument('--compare', action='store_true', help='compare the result with the stored baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return 0
+
+    runs = [measure() for _ in range(args.runs)]
+    result = {
+        'streamlit_seconds': statistics.median(run['streamlit_seconds'] for run in runs),
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'heavy_modules': runs[-1]['heavy_modules'],
+    }
+    print(f'streamlit: {result["streamlit_seconds"]:.3f} s, dashboard modules: {result["seconds"]:.3f} s '
+          f'(median of {args.runs} runs)')
+    print('heavy libraries loaded at startup:', ', '.join(result['heavy_modules']) or 'none')
+    print('slowest imports:')
+    for name, seconds in slowest_imports():
+        print(f'    {name:<40}{seconds:>8.3f} s')
+
+    status = 0
+    if args.compare:
+        with open(BASELINES) as file:
+            baseline = json.load(file).get('startup')
+        if baseline is not None and result['seconds'] > baseline['seconds'] * (1 + args.tolerance):
+            print(f'REGRESSION startup: seconds {baseline["seconds"]:.3f} -> {result["seconds"]:.3f}')
+            status = 1
+        for module in set(result['heavy_modules']) - set(baseline['heavy_modules'] if baseline else ()):
+            print(f'REGRESSION startup: {module} is imported at startup')
+            status = 1
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(BASELINES):
+            with open(BASELINES) as file:
+                baselines = json.load(file)
+        baselines['startup'] = result
+        with open(BASELINES, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
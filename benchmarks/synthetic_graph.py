@@ -0,0 +1,117 @@
+import argparse
+
+import numpy as np
+
+'''This file generates synthetic GraphML files with the schema of the crisis dataset, for the benchmarks.
+
+Usage: python benchmarks/synthetic_graph.py graph.graphml --edges 1000000
+'''
+
+EVENT_TYPES = ('flood', 'wildfire', 'earthquake', 'shooting', 'bombing', 'typhoon')
+EVENTS_PER_TYPE = 5
+NUM_CATEGORIES = 25
+PRIORITIES = ('Low', 'Medium', 'High', 'Critical')
+
+# Average number of edges of each type per tweet (POSTED, IS_ABOUT and HAS_CATEGORY link the tweets, the others
+# are retweets / replies between tweets and interactions between users)
+EDGES_PER_TWEET = {
+    'POSTED': 1.0,
+    'IS_ABOUT': 1.1,
+    'HAS_CATEGORY': 1.0,
+    'RETWEETED': 0.3,
+    'REPLY_TO': 0.2,
+    'RETWEETS': 0.3,
+    'REPLIED_TO': 0.2,
+    'MENTIONS': 0.4,
+}
+TWEETS_PER_USER = 5
+TWEETS_PER_HASHTAG = 20
+
+CHUNK = 100_000
+
+KEYS = (('labels', 'node'), ('id', 'node'), ('name', 'node'), ('eventType', 'node'), ('created_at', 'node'),
+        ('annotation_postPriority', 'node'), ('text', 'node'), ('label', 'edge'))
+
+def _popular(rng, size, n):
+    # Skewed choice of n items (a few users / tweets get most of the retweets, like in the real dataset)
+    return np.minimum((rng.pareto(1.2, size) * n / 50).astype(np.int64), n - 1)
+
+# Function to write a synthetic crisis graph with about num_edges edges
+def write_synthetic_graph(path, num_edges, seed=0):
+    rng = np.random.default_rng(seed)
+    num_tweets = max(int(num_edges / sum(EDGES_PER_TWEET.values())), 10)
+    num_users = max(num_tweets // TWEETS_PER_USER, 2)
+    num_hashtags = max(num_tweets // TWEETS_PER_HASHTAG, 1)
+    num_events = len(EVENT_TYPES) * EVENTS_PER_TYPE
+
+    # Node codes: events, categories, hashtags, users, then tweets
+    first_category = num_events
+    first_hashtag = first_category + NUM_CATEGORIES
+    first_user = first_hashtag + num_hashtags
+    first_tweet = first_user + num_users
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for name, domain in KEYS:
+            file.write(f'<key id="{name}" for="{domain}" attr.name="{name}" attr.type="string"/>\n')
+        file.write('<graph id="G" edgedefault="directed">\n')
+
+        for i in range(num_events):
+            file.write(f'<node id="n{i}" labels=":Event"><data key="labels">:Event</data><data key="id">event{i}</data>'
+                       f'<data key="eventType">{EVENT_TYPES[i % len(EVENT_TYPES)]}</data></node>\n')
+        for i in range(NUM_CATEGORIES):
+            file.write(f'<node id="n{first_category + i}" labels=":PostCategory"><data key="labels">:PostCategory</data>'
+                       f'<data key="id">Category{i}</data></node>\n')
+        for i in range(num_hashtags):
+            file.write(f'<node id="n{first_hashtag + i}" labels=":Hashtag"><data key="labels">:Hashtag</data>'
+                       f'<data key="id">hashtag{i}</data></node>\n')
+        for i in range(num_users):
+            file.write(f'<node id="n{first_user + i}" labels=":User"><data key="labels">:User</data>'
+                       f'<data key="id">{10 ** 9 + i}</data><data key="name">user {i % (num_users // 2 + 1)}</data></node>\n')
+
+        start, end = np.datetime64('2012-01-01T00:00:00'), np.datetime64('2019-12-31T00:00:00')
+        for chunk in range(0, num_tweets, CHUNK):
+            size = min(CHUNK, num_tweets - chunk)
+            dates = np.datetime_as_string(start + rng.integers(0, (end - start).astype(int), size), unit='s')
+            priorities = rng.integers(0, len(PRIORITIES) + 1, size)  # the last value means "not annotated"
+            for i in range(size):
+                priority = priorities[i]
+                annotation = f'<data key="annotation_postPriority">{PRIORITIES[priority]}</data>' if priority < len(PRIORITIES) else ''
+                file.write(f'<node id="n{first_tweet + chunk + i}" labels=":Tweet"><data key="labels">:Tweet</data>'
+                           f'<data key="id">{2 * 10 ** 17 + chunk + i}</data><data key="created_at">{dates[i]}Z</data>'
+                           f'{annotation}<data key="text">synthetic tweet {chunk + i}</data></node>\n')
+
+        edge_id = 0
+        for chunk in range(0, num_tweets, CHUNK):
+            size = min(CHUNK, num_tweets - chunk)
+            tweets = first_tweet + chunk + np.arange(size)
+            for label, per_tweet in EDGES_PER_TWEET.items():
+                count = rng.poisson(per_tweet * size)
+                if label == 'POSTED':
+                    sources, targets = first_user + rng.integers(0, num_users, size), tweets
+                elif label == 'IS_ABOUT':
+                    sources = np.concatenate([tweets, rng.choice(tweets, max(count - size, 0))])
+                    targets = rng.integers(0, num_events, len(sources))
+                elif label == 'HAS_CATEGORY':
+                    sources, targets = tweets, first_category + rng.integers(0, NUM_CATEGORIES, size)
+                elif label in ('RETWEETED', 'REPLY_TO'):
+                    sources, targets = rng.choice(tweets, count), first_tweet + _popular(rng, count, num_tweets)
+                else:
+                    sources, targets = first_user + rng.integers(0, num_users, count), first_user + _popular(rng, count, num_users)
+                for source, target in zip(sources.tolist(), targets.tolist()):
+                    file.write(f'<edge id="e{edge_id}" source="n{source}" target="n{target}" label="{label}">'
+                               f'<data key="label">{label}</data></edge>\n')
+                    edge_id += 1
+
+        file.write('</graph>\n</graphml>\n')
+    return edge_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic crisis graph (GraphML)')
+    parser.add_argument('path')
+    parser.add_argument('--edges', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(write_synthetic_graph(args.path, args.edges, args.seed), 'edges written to', args.path)